@@ -1,80 +1,50 @@
 """AI service for AIREA Real Estate Chatbot."""
 
-from typing import List, Union, Dict, Any
+import functools
+import hashlib
+import itertools
+import logging
+import re
+import threading
+import time
+from typing import Iterator, List, Union, Dict, Any, Optional
 from google import genai
-from google.genai import types
-from models import Client, ChatMessage
+import orjson
+from google.genai import types, errors
+from pydantic import TypeAdapter, ValidationError
+from models import Client, ChatMessage, StageAnalysis
 from config import Config
 
-class AIService:
-    """Service for AI-powered chat and data extraction."""
-    
-    def __init__(self):
-        self.client = genai.Client(api_key=Config.GEMINI_API_KEY)
-        self.system_prompt = self._load_system_prompt()
-    
-    def _load_system_prompt(self) -> str:
-        """Load system prompt from file."""
-        try:
-            with open("systempromt.txt", "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            # Default system prompt if file not found
-            return """You are AIREA, a friendly and professional real estate assistant. 
-            Help users with their property needs - buying, selling, or renting. 
-            Collect essential information like name, contact details, property preferences, budget, and location.
-            Be conversational and helpful while gathering the necessary information."""
-    
-    def generate_chat_response(self, input_data: Union[str, List[ChatMessage]]) -> str:
-        """Generate AI response for user input."""
-        try:
-            # Convert input to string format for the AI
-            if isinstance(input_data, list):
-                # Format conversation history
-                conversation_text = ""
-                for message in input_data:
-                    role = "User" if message.role == "user" else "Assistant"
-                    conversation_text += f"{role}: {message.content}\n"
-                input_text = conversation_text
-            else:
-                input_text = str(input_data)
-            
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_prompt,
-                    temperature=0.7,
-                    max_output_tokens=1000
-                ),
-                contents=input_text
-            )
-            
-            return response.text
-            
-        except Exception as e:
-            print(f"Error generating AI response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
-    
-    def extract_client_data(self, conversation_data: Union[Dict, str, List[ChatMessage]]) -> List[Client]:
-        """Extract client data from conversation."""
-        try:
-            # Format conversation for extraction
-            if isinstance(conversation_data, list):
-                # Convert ChatMessage objects to dict format
-                formatted_conversation = []
-                for message in conversation_data:
-                    if isinstance(message, ChatMessage):
-                        formatted_conversation.append({
-                            "role": message.role,
-                            "content": message.content
-                        })
-                    else:
-                        formatted_conversation.append(message)
-                conversation_text = str(formatted_conversation)
-            else:
-                conversation_text = str(conversation_data)
-            
-            extraction_prompt = f"""
+MODEL_NAME = "gemini-2.0-flash-exp"
+
+CHAT_ERROR_MESSAGE = "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
+
+# Time-to-live for the explicit context cache holding the system prompt
+CACHE_TTL = "3600s"
+
+logger = logging.getLogger(__name__)
+
+NON_DIGIT_PATTERN = re.compile(r"\D+")
+
+# Built once so the list validator schema is not recompiled per call
+CLIENT_LIST_ADAPTER = TypeAdapter(List[Client])
+
+# Shared fallback analysis; treat as read-only
+UNKNOWN_STAGE_ANALYSIS = StageAnalysis(stage="unknown").model_dump()
+
+ANALYSIS_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": StageAnalysis,
+}
+
+BATCH_TERMINAL_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+EXTRACTION_INSTRUCTIONS = """
 Extract client information from this real estate conversation between AIREA and the user.
 
 REQUIRED SCHEMA FIELDS:
@@ -100,46 +70,245 @@ EXTRACTION RULES:
 6. If required fields are missing, don't create a client record
 7. Return empty array if no complete client data found
 
-CONVERSATION:
-{conversation_text}
-
 Extract and return as JSON array of client objects following the exact schema.
 """
+
+# Shared Gemini client; one connection pool per process
+_client: Optional[genai.Client] = None
+
+def get_client() -> genai.Client:
+    """Get the process-wide Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = genai.Client(
+            api_key=Config.GEMINI_API_KEY,
+            http_options=types.HttpOptions(timeout=30_000)
+        )
+    return _client
+
+# Explicit context cache for the system prompt, resolved once per process on first use
+_instruction_cache: Optional[str] = None
+_instruction_cache_resolved = False
+_instruction_cache_lock = threading.Lock()
+
+def _find_or_create_instruction_cache() -> Optional[str]:
+    """Reuse the system prompt cache left by an earlier process, or create one."""
+    client = get_client()
+    system_prompt = _load_system_prompt()
+    # Named after the prompt's content, so an edited prompt never reuses stale instructions
+    display_name = "airea-system-prompt-" + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+    try:
+        for cache in client.caches.list():
+            if cache.display_name == display_name and (cache.model or "").endswith(MODEL_NAME):
+                client.caches.update(name=cache.name, config=types.UpdateCachedContentConfig(ttl=CACHE_TTL))
+                return cache.name
+        
+        cache = client.caches.create(
+            model=MODEL_NAME,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=system_prompt,
+                ttl=CACHE_TTL
+            )
+        )
+        return cache.name
+    except Exception as e:
+        # Caching has a minimum token size and is not available on every model
+        logger.warning("Context cache unavailable, using inline instructions: %s", e)
+        return None
+
+def get_instruction_cache(refresh: bool = False) -> Optional[str]:
+    """Get the name of the system prompt's context cache, or None if it is unavailable.
+    
+    Resolved on first use and then shared by every AIService in the process;
+    pass refresh=True after the cache has expired to resolve it again.
+    """
+    global _instruction_cache, _instruction_cache_resolved
+    with _instruction_cache_lock:
+        if refresh or not _instruction_cache_resolved:
+            _instruction_cache = _find_or_create_instruction_cache()
+            _instruction_cache_resolved = True
+        return _instruction_cache
+
+def format_chat_history(messages: List[ChatMessage]) -> str:
+    """Format messages as "User: ..."/"Assistant: ..." lines."""
+    return "".join(
+        f"{'User' if message.role == 'user' else 'Assistant'}: {message.content}\n"
+        for message in messages
+    )
+
+@functools.lru_cache(maxsize=1)
+def _load_system_prompt() -> str:
+    """Load system prompt from file (read at most once per process)."""
+    try:
+        with open("systempromt.txt", "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        # Default system prompt if file not found
+        return """You are AIREA, a friendly and professional real estate assistant. 
+        Help users with their property needs - buying, selling, or renting. 
+        Collect essential information like name, contact details, property preferences, budget, and location.
+        Be conversational and helpful while gathering the necessary information."""
+
+# Static analysis scaffolding; the conversation is appended after it so the
+# prompt prefix is byte-identical across calls and eligible for implicit caching
+ANALYSIS_PREAMBLE = """
+Analyze this real estate conversation and determine:
+1. What stage is the conversation in? (welcome, needs_assessment, requirements_gathering, contact_info, appointment_scheduling, complete)
+2. What information has been collected so far?
+3. What information is still needed?
+4. Is the user ready for the next step?
+5. Any concerns or hesitations detected?
+
+Respond in JSON format with keys: stage, collected_info, missing_info, ready_for_next_step, concerns
+"""
+
+class AIService:
+    """Service for AI-powered chat and data extraction."""
+    
+    def __init__(self):
+        self.client = get_client()
+        self.system_prompt = _load_system_prompt()
+        # Static instructions by purpose; only the system prompt is large enough
+        # for an explicit context cache, the extraction rules are always sent inline
+        self.instructions = {
+            "chat": self.system_prompt,
+            "extraction": EXTRACTION_INSTRUCTIONS,
+        }
+    
+    def _generate_cached(self, cache_key: str, contents: Any, stream: bool = False, **config_kwargs):
+        """Generate content against the cached instructions when available, re-resolving them if expired.
+        
+        With stream=True an iterator of response chunks is returned instead.
+        """
+        def _call(config: types.GenerateContentConfig):
+            if not stream:
+                return self.client.models.generate_content(model=MODEL_NAME, config=config, contents=contents)
             
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=extraction_prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": list[Client],
-                }
+            # The request is only sent on first iteration, so pull the first chunk
+            # here to surface errors (e.g. an expired cache) before returning
+            chunks = self.client.models.generate_content_stream(model=MODEL_NAME, config=config, contents=contents)
+            first_chunk = next(chunks, None)
+            return itertools.chain([first_chunk] if first_chunk is not None else [], chunks)
+        
+        # Only the system prompt has a context cache; a second attempt follows an expired cache
+        cache_attempts = 2 if cache_key == "chat" else 0
+        for attempt in range(cache_attempts):
+            cache_name = get_instruction_cache(refresh=attempt > 0)
+            if not cache_name:
+                break
+            try:
+                return _call(types.GenerateContentConfig(cached_content=cache_name, **config_kwargs))
+            except errors.ClientError as e:
+                if e.code != 404:
+                    raise
+                # Cache expired or was evicted - resolve it again and retry
+        
+        return _call(types.GenerateContentConfig(
+            system_instruction=self.instructions[cache_key],
+            **config_kwargs
+        ))
+    
+    def _chat_contents(self, input_data: Union[str, List[ChatMessage]]) -> Union[str, List[types.Content]]:
+        """Convert chat input into request contents."""
+        # Send history as role-tagged turns so earlier turns form a stable prefix
+        if isinstance(input_data, list):
+            return [
+                types.Content(
+                    role="user" if message.role == "user" else "model",
+                    parts=[types.Part(text=message.content)]
+                )
+                for message in input_data
+            ]
+        return str(input_data)
+    
+    def generate_chat_response_stream(self, input_data: Union[str, List[ChatMessage]]) -> Iterator[str]:
+        """Stream the AI response for user input as text chunks."""
+        started = False
+        try:
+            chunks = self._generate_cached(
+                "chat",
+                self._chat_contents(input_data),
+                stream=True,
+                temperature=0.7,
+                max_output_tokens=1000
+            )
+            
+            for chunk in chunks:
+                if chunk.text:
+                    started = True
+                    yield chunk.text
+            
+        except Exception as e:
+            print(f"Error generating AI response: {e}")
+            # Only apologise if nothing has been sent yet; a partial answer is kept as is
+            if not started:
+                yield CHAT_ERROR_MESSAGE
+    
+    def generate_chat_response(self, input_data: Union[str, List[ChatMessage]]) -> str:
+        """Generate AI response for user input."""
+        return "".join(self.generate_chat_response_stream(input_data))
+    
+    def _format_extraction_conversation(self, conversation_data: Union[Dict, str, List[ChatMessage]]) -> str:
+        """Format conversation data as text for the extraction prompt."""
+        if isinstance(conversation_data, list):
+            # Convert ChatMessage objects to dict format
+            formatted_conversation = []
+            for message in conversation_data:
+                if isinstance(message, ChatMessage):
+                    formatted_conversation.append({
+                        "role": message.role,
+                        "content": message.content
+                    })
+                else:
+                    formatted_conversation.append(message)
+            return str(formatted_conversation)
+        return str(conversation_data)
+    
+    def _validate_clients(self, parsed_clients: List[Any]) -> List[Client]:
+        """Clean and validate raw extracted client records."""
+        records = []
+        for client_data in parsed_clients:
+            try:
+                fields = dict(client_data if isinstance(client_data, dict) else client_data.__dict__)
+            except (TypeError, ValueError, AttributeError) as conversion_error:
+                print(f"Validation error for client data: {conversion_error}")
+                continue
+            
+            # Additional validation and cleaning
+            if fields.get('phone'):
+                # Clean phone number: 10-digit numbers stay bare, anything else gets a + prefix
+                phone = NON_DIGIT_PATTERN.sub("", str(fields['phone']))
+                fields['phone'] = phone if len(phone) == 10 else '+' + phone
+            records.append(fields)
+        
+        # Validate all records in one pass; fall back to per-record validation so
+        # a single bad record does not discard the rest
+        try:
+            return CLIENT_LIST_ADAPTER.validate_python(records)
+        except ValidationError:
+            validated_clients = []
+            for fields in records:
+                try:
+                    validated_clients.append(Client.model_validate(fields))
+                except ValidationError as validation_error:
+                    print(f"Validation error for client data: {validation_error}")
+            return validated_clients
+    
+    def extract_client_data(self, conversation_data: Union[Dict, str, List[ChatMessage]]) -> List[Client]:
+        """Extract client data from conversation."""
+        try:
+            extraction_prompt = "CONVERSATION:\n" + self._format_extraction_conversation(conversation_data)
+            
+            response = self._generate_cached(
+                "extraction",
+                extraction_prompt,
+                response_mime_type="application/json",
+                response_schema=list[Client]
             )
             
             if response.parsed:
-                # Validate extracted data
-                validated_clients = []
-                for client_data in response.parsed:
-                    try:
-                        # Additional validation and cleaning
-                        if hasattr(client_data, 'phone') and client_data.phone:
-                            # Clean phone number
-                            phone = ''.join(filter(str.isdigit, str(client_data.phone)))
-                            if len(phone) == 10:
-                                client_data.phone = phone
-                            elif len(phone) == 11 and phone.startswith('1'):
-                                client_data.phone = '+' + phone
-                            else:
-                                client_data.phone = '+' + phone if not phone.startswith('+') else phone
-                        
-                        # Validate the client object
-                        validated_client = Client(**client_data.__dict__ if hasattr(client_data, '__dict__') else client_data)
-                        validated_clients.append(validated_client)
-                        
-                    except Exception as validation_error:
-                        print(f"Validation error for client data: {validation_error}")
-                        continue
-                
-                return validated_clients
+                return self._validate_clients(response.parsed)
             else:
                 print("No client data could be extracted from the conversation")
                 return []
@@ -148,53 +317,159 @@ Extract and return as JSON array of client objects following the exact schema.
             print(f"Error extracting client data: {e}")
             return []
     
-    def analyze_conversation_stage(self, messages: List[ChatMessage]) -> Dict[str, Any]:
-        """Analyze the current stage of the conversation."""
+    def extract_client_data_batch(
+        self,
+        conversations: List[List[ChatMessage]],
+        poll_interval: float = 30.0,
+        timeout: float = 24 * 3600
+    ) -> List[List[Client]]:
+        """Extract client data from many conversations with a single Gemini batch job.
+        
+        Intended for non-interactive paths; live chat turns should keep using
+        extract_client_data. Returns one list of clients per input conversation,
+        in the same order.
+        """
+        if not conversations:
+            return []
+        
+        empty_results: List[List[Client]] = [[] for _ in conversations]
+        
         try:
-            conversation_text = ""
-            for message in messages:
-                role = "User" if message.role == "user" else "Assistant"
-                conversation_text += f"{role}: {message.content}\n"
+            inline_requests = [
+                {
+                    "contents": [{
+                        "role": "user",
+                        "parts": [{"text": "CONVERSATION:\n" + self._format_extraction_conversation(messages)}]
+                    }],
+                    "config": {
+                        "system_instruction": EXTRACTION_INSTRUCTIONS,
+                        "response_mime_type": "application/json",
+                        "response_schema": list[Client],
+                    }
+                }
+                for messages in conversations
+            ]
             
-            analysis_prompt = f"""
-            Analyze this real estate conversation and determine:
-            1. What stage is the conversation in? (welcome, needs_assessment, requirements_gathering, contact_info, appointment_scheduling, complete)
-            2. What information has been collected so far?
-            3. What information is still needed?
-            4. Is the user ready for the next step?
-            5. Any concerns or hesitations detected?
+            job = self.client.batches.create(
+                model=MODEL_NAME,
+                src=inline_requests,
+                config={"display_name": "airea-client-extraction"}
+            )
             
-            Conversation:
-            {conversation_text}
+            deadline = time.monotonic() + timeout
+            while job.state.name not in BATCH_TERMINAL_STATES:
+                if time.monotonic() > deadline:
+                    print(f"Batch extraction job {job.name} timed out")
+                    return empty_results
+                time.sleep(poll_interval)
+                job = self.client.batches.get(name=job.name)
             
-            Respond in JSON format with keys: stage, collected_info, missing_info, ready_for_next_step, concerns
-            """
+            if job.state.name != "JOB_STATE_SUCCEEDED":
+                print(f"Batch extraction job {job.name} finished with state {job.state.name}")
+                return empty_results
             
+            results = []
+            for inline_response in job.dest.inlined_responses:
+                if inline_response.response and inline_response.response.text:
+                    results.append(self._validate_clients(orjson.loads(inline_response.response.text)))
+                else:
+                    if inline_response.error:
+                        print(f"Batch extraction request failed: {inline_response.error}")
+                    results.append([])
+            return results
+        
+        except Exception as e:
+            print(f"Error running batch client extraction: {e}")
+            return empty_results
+    
+    def _build_analysis_prompt(self, messages: List[ChatMessage], formatted_history: Optional[str] = None) -> str:
+        """Build the conversation stage analysis prompt, reusing pre-formatted history if given."""
+        if formatted_history is None:
+            formatted_history = format_chat_history(messages)
+        
+        return ANALYSIS_PREAMBLE + "\nConversation:\n" + formatted_history
+    
+    def _parse_stage_analysis(self, response) -> Dict[str, Any]:
+        """Get the stage analysis dict from a schema-constrained response."""
+        if isinstance(response.parsed, StageAnalysis):
+            return response.parsed.model_dump()
+        if response.text:
+            return StageAnalysis.model_validate(orjson.loads(response.text)).model_dump()
+        return UNKNOWN_STAGE_ANALYSIS
+    
+    def _collected_from_flags(self, features: Dict[str, Any]) -> Dict[str, bool]:
+        """Map incremental conversation flags to the information collected so far."""
+        return {
+            "client_type": features["type_hit"],
+            "name": features["name_hit"],
+            "email": features["has_at"] and features["has_dot"],
+            "phone": features["digit_count"] >= 10,
+            "property_requirements": (
+                (features["sell_hit"] and features["addr_hit"])
+                or (features["buy_hit"] and features["pref_hit"])
+            )
+        }
+    
+    def stage_from_flags(self, features: Dict[str, Any]) -> Optional[str]:
+        """Determine the conversation stage from flags alone, or None if it needs the LLM.
+        
+        Stages up to contact collection follow directly from which information is
+        still missing; once everything is collected, telling appointment scheduling
+        apart from a finished conversation needs the model.
+        """
+        collected = self._collected_from_flags(features)
+        if not collected["client_type"]:
+            return "needs_assessment"
+        if not collected["property_requirements"]:
+            return "requirements_gathering"
+        if not (collected["name"] and collected["email"] and collected["phone"]):
+            return "contact_info"
+        return None
+    
+    def analysis_from_flags(self, features: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build a stage analysis locally when the flags determine the stage."""
+        stage = self.stage_from_flags(features)
+        if stage is None:
+            return None
+        
+        collected = self._collected_from_flags(features)
+        return {
+            "stage": stage,
+            "collected_info": [field for field, present in collected.items() if present],
+            "missing_info": [field for field, present in collected.items() if not present],
+            "ready_for_next_step": True,
+            "concerns": []
+        }
+    
+    def analyze_conversation_stage(self, messages: List[ChatMessage], formatted_history: Optional[str] = None) -> Dict[str, Any]:
+        """Analyze the current stage of the conversation."""
+        try:
             response = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=analysis_prompt,
-                config={
-                    "response_mime_type": "application/json",
-                }
+                model=MODEL_NAME,
+                contents=self._build_analysis_prompt(messages, formatted_history),
+                config=ANALYSIS_CONFIG
             )
             
-            if response.parsed:
-                return response.parsed
-            else:
-                return {
-                    "stage": "unknown",
-                    "collected_info": [],
-                    "missing_info": [],
-                    "ready_for_next_step": True,
-                    "concerns": []
-                }
+            return self._parse_stage_analysis(response)
+                
+        except Exception as e:
+            print(f"Error analyzing conversation stage: {e}")
+            return UNKNOWN_STAGE_ANALYSIS
+    
+    async def _agenerate(self, **kwargs):
+        """Generate content with the async client (shares the SDK's pooled HTTP client)."""
+        return await self.client.aio.models.generate_content(model=MODEL_NAME, **kwargs)
+    
+    async def aanalyze_conversation_stage(self, messages: List[ChatMessage], formatted_history: Optional[str] = None) -> Dict[str, Any]:
+        """Async variant of analyze_conversation_stage for concurrent bulk analysis."""
+        try:
+            response = await self._agenerate(
+                contents=self._build_analysis_prompt(messages, formatted_history),
+                config=ANALYSIS_CONFIG
+            )
+            
+            return self._parse_stage_analysis(response)
                 
         except Exception as e:
             print(f"Error analyzing conversation stage: {e}")
-            return {
-                "stage": "unknown",
-                "collected_info": [],
-                "missing_info": [],
-                "ready_for_next_step": True,
-                "concerns": []
-            }
\ No newline at end of file
+            return UNKNOWN_STAGE_ANALYSIS
\ No newline at end of file
@@ -16,6 +16,11 @@ class Config:
     
     # Database Configuration
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'real_estate_clients.db')
+    DATABASE_SHARED_CACHE = os.getenv('DATABASE_SHARED_CACHE', 'false').lower() == 'true'
+    
+    # Conversation Storage Configuration (shared across workers when REDIS_URL is set)
+    REDIS_URL = os.getenv('REDIS_URL')
+    CONVERSATION_TTL_HOURS = int(os.getenv('CONVERSATION_TTL_HOURS', '24'))
     
     # Email Configuration
     EMAIL_CONFIG = {
@@ -34,6 +39,9 @@ class Config:
     # CORS Configuration
     CORS_ORIGINS = ["*"]  # Configure appropriately for production
     
+    # Logging Configuration
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    
     # Frontend Configuration
     FRONTEND_PATH = "frontend/out"
     
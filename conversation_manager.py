@@ -1,58 +1,212 @@
 """Conversation management for AIREA Real Estate Chatbot."""
 
+import asyncio
+import orjson
+import re
+import time
 import uuid
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, FrozenSet
 from datetime import datetime
 from models import ChatMessage, Client
 from database import DatabaseManager
-from ai_service import AIService
+from ai_service import AIService, format_chat_history
+from conversation_store import ConversationStore, RedisConversationStore
+
+# Keyword sets used to decide when a conversation is ready for extraction
+NAME_KEYWORDS = ("name", "i'm", "i am", "call me", "my name")
+CLIENT_TYPE_KEYWORDS = ("buy", "sell", "buyer", "seller", "buying", "selling")
+ADDRESS_KEYWORDS = ("address", "street", "road", "avenue", "drive", "lane", "boulevard")
+PREFERENCE_KEYWORDS = ("area", "neighborhood", "budget", "price", "looking", "house", "apartment", "condo")
+
+# Feature tag for each keyword set; "buy"/"sell" also gate the address/preference checks
+KEYWORD_SETS = (
+    ("name", NAME_KEYWORDS),
+    ("type", CLIENT_TYPE_KEYWORDS),
+    ("buy", ("buy",)),
+    ("sell", ("sell",)),
+    ("addr", ADDRESS_KEYWORDS),
+    ("pref", PREFERENCE_KEYWORDS),
+)
+
+def _build_keyword_tags() -> Dict[str, FrozenSet[str]]:
+    """Map each keyword to its tags, including the tags of any keyword it starts with."""
+    tags: Dict[str, set] = {}
+    for tag, words in KEYWORD_SETS:
+        for word in words:
+            tags.setdefault(word, set()).add(tag)
+    return {
+        word: frozenset().union(*(tags[other] for other in tags if word.startswith(other)))
+        for word in tags
+    }
+
+KEYWORD_TAGS = _build_keyword_tags()
+MAX_KEYWORD_LENGTH = max(len(word) for word in KEYWORD_TAGS)
+
+# Single-pass matcher over all keyword sets. The lookahead reports overlapping
+# matches and longest-first ordering (plus prefix tags above) keeps it exact.
+KEYWORD_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(word) for word in sorted(KEYWORD_TAGS, key=len, reverse=True)) + "))"
+)
 
 class ConversationManager:
     """Manages conversation state and flow."""
     
-    def __init__(self, db_manager: DatabaseManager, ai_service: AIService):
+    def __init__(self, db_manager: DatabaseManager, ai_service: AIService,
+                 shared_store: Optional[RedisConversationStore] = None):
         self.db_manager = db_manager
         self.ai_service = ai_service
-        # In-memory conversation storage (consider Redis for production)
-        self.active_conversations: Dict[str, List[ChatMessage]] = {}
-        self.conversation_metadata: Dict[str, Dict[str, Any]] = {}
+        # In-memory conversation storage; with a shared store it acts as a
+        # per-worker cache that is refreshed from Redis before each operation
+        self.store = ConversationStore()
+        self.shared_store = shared_store
     
     def create_conversation(self) -> str:
         """Create a new conversation and return its ID."""
         conversation_id = f"conv_{uuid.uuid4().hex[:12]}_{int(datetime.now().timestamp())}"
-        self.active_conversations[conversation_id] = []
-        self.conversation_metadata[conversation_id] = {
-            "created_at": datetime.now(),
-            "stage": "welcome",
+        idx = self.store.add(conversation_id, created_at=datetime.now(), created_at_s=time.monotonic(), extra={
             "client_type": None,
             "extracted_clients": [],
-            "processed": False
-        }
+            "features": self._new_features()
+        })
+        self._publish_metadata(idx)
         return conversation_id
     
+    def _metadata_at(self, idx: int) -> Dict[str, Any]:
+        """Build the metadata dict for the conversation stored at a row index."""
+        store = self.store
+        return {
+            "created_at": store.created_at[idx],
+            "updated_at": store.updated_at[idx],
+            "stage": store.stage[idx],
+            "processed": store.processed[idx],
+            **store.extra[idx]
+        }
+    
+    def _publish_metadata(self, idx: int) -> None:
+        """Write a conversation's metadata through to the shared store."""
+        if self.shared_store is not None:
+            self.shared_store.save_metadata(self.store.ids[idx], self._metadata_at(idx))
+    
+    def _sync(self, conversation_id: str) -> None:
+        """Refresh the local copy of a conversation from the shared store."""
+        self._sync_many([conversation_id])
+    
+    def _sync_many(self, conversation_ids: List[str]) -> None:
+        """Refresh the local copies of several conversations in one shared-store round trip."""
+        if self.shared_store is None or not conversation_ids:
+            return
+        
+        store = self.store
+        requests = []
+        for conversation_id in conversation_ids:
+            idx = store.get_index(conversation_id)
+            requests.append((conversation_id, len(store.messages[idx]) if idx is not None else 0))
+        
+        for conversation_id, loaded in zip(conversation_ids, self.shared_store.load_many(requests)):
+            if loaded is None:
+                # Expired or deleted by another worker
+                store.remove(conversation_id)
+                continue
+            
+            # Looked up again since removals above move rows
+            idx = store.get_index(conversation_id)
+            new_messages, metadata = loaded
+            if idx is None:
+                idx = store.add(conversation_id)
+            store.append_messages(idx, new_messages, format_chat_history(new_messages))
+            
+            if metadata is not None:
+                metadata = dict(metadata)
+                created_at = metadata.pop("created_at")
+                store.created_at[idx] = created_at
+                store.created_at_s[idx] = time.monotonic() - (datetime.now() - created_at).total_seconds()
+                store.set_updated_at(idx, metadata.pop("updated_at", None))
+                store.stage[idx] = metadata.pop("stage", "unknown")
+                store.processed[idx] = metadata.pop("processed", False)
+                store.extra[idx] = metadata
+    
+    def _new_features(self) -> Dict[str, Any]:
+        """Create the incremental extraction-readiness flags for a conversation."""
+        return {
+            "digit_count": 0,
+            "has_at": False,
+            "has_dot": False,
+            "name_hit": False,
+            "type_hit": False,
+            "buy_hit": False,
+            "sell_hit": False,
+            "addr_hit": False,
+            "pref_hit": False,
+            # Lowercased tail of the text seen so far, long enough to complete any keyword
+            "text_tail": ""
+        }
+    
+    def _update_features(self, features: Dict[str, Any], content: str) -> None:
+        """Fold a new message into the extraction-readiness flags."""
+        text = content.lower()
+        features["digit_count"] += sum(c.isdigit() for c in text)
+        features["has_at"] = features["has_at"] or "@" in text
+        features["has_dot"] = features["has_dot"] or "." in text
+        
+        # Scan the new message after the previous tail so keywords spanning a
+        # message boundary match as they would in the space-joined conversation
+        window = features["text_tail"] + " " + text if features["text_tail"] else text
+        for match in KEYWORD_PATTERN.finditer(window):
+            for tag in KEYWORD_TAGS[match.group(1)]:
+                features[f"{tag}_hit"] = True
+        features["text_tail"] = window[-(MAX_KEYWORD_LENGTH - 1):]
+    
     def add_message(self, conversation_id: str, message: ChatMessage) -> None:
         """Add a message to the conversation."""
-        if conversation_id not in self.active_conversations:
-            self.active_conversations[conversation_id] = []
+        self._sync(conversation_id)
+        store = self.store
+        idx = store.get_index(conversation_id)
+        if idx is None:
+            idx = store.add(conversation_id)
         
-        self.active_conversations[conversation_id].append(message)
+        store.append_messages(idx, [message], format_chat_history([message]))
         
         # Update conversation metadata
-        if conversation_id in self.conversation_metadata:
-            self.conversation_metadata[conversation_id]["updated_at"] = datetime.now()
+        tracked = store.created_at[idx] is not None
+        if tracked:
+            store.set_updated_at(idx, datetime.now())
+            self._update_features(store.extra[idx]["features"], message.content)
+        
+        if self.shared_store is not None:
+            self.shared_store.append_message(conversation_id, message, self._metadata_at(idx) if tracked else None)
+    
+    def _tracked_index(self, conversation_id: str) -> Optional[int]:
+        """Get the store index of a conversation created by this manager."""
+        idx = self.store.get_index(conversation_id)
+        if idx is None or self.store.created_at[idx] is None:
+            return None
+        return idx
     
     def get_conversation(self, conversation_id: str) -> Optional[List[ChatMessage]]:
         """Get conversation messages by ID."""
-        return self.active_conversations.get(conversation_id)
+        self._sync(conversation_id)
+        idx = self.store.get_index(conversation_id)
+        return self.store.messages[idx] if idx is not None else None
+    
+    def get_formatted_history(self, conversation_id: str) -> Optional[str]:
+        """Get the conversation as "User: ..."/"Assistant: ..." text, built incrementally."""
+        self._sync(conversation_id)
+        idx = self.store.get_index(conversation_id)
+        return self.store.history[idx] if idx is not None else None
     
     def get_conversation_metadata(self, conversation_id: str) -> Optional[Dict[str, Any]]:
-        """Get conversation metadata."""
-        return self.conversation_metadata.get(conversation_id)
+        """Get a snapshot of the conversation metadata."""
+        self._sync(conversation_id)
+        idx = self._tracked_index(conversation_id)
+        return self._metadata_at(idx) if idx is not None else None
     
     def update_conversation_stage(self, conversation_id: str, stage: str) -> None:
         """Update the conversation stage."""
-        if conversation_id in self.conversation_metadata:
-            self.conversation_metadata[conversation_id]["stage"] = stage
+        self._sync(conversation_id)
+        idx = self._tracked_index(conversation_id)
+        if idx is not None:
+            self.store.stage[idx] = stage
+            self._publish_metadata(idx)
     
     def analyze_conversation_progress(self, conversation_id: str) -> Dict[str, Any]:
         """Analyze conversation progress and determine next steps."""
@@ -60,53 +214,86 @@ class ConversationManager:
         if not messages:
             return {"error": "Conversation not found"}
         
-        # Use AI service to analyze conversation stage
-        analysis = self.ai_service.analyze_conversation_stage(messages)
-        
-        # Update metadata with analysis
-        if conversation_id in self.conversation_metadata:
-            self.conversation_metadata[conversation_id].update({
-                "stage": analysis.get("stage", "unknown"),
-                "analysis": analysis
-            })
+        # Use local rules when they settle the stage, otherwise ask the AI service
+        analysis = self._local_analysis(conversation_id)
+        if analysis is None:
+            analysis = self.ai_service.analyze_conversation_stage(
+                messages, self.store.history[self.store.index[conversation_id]]
+            )
+        self._record_analysis(conversation_id, analysis)
         
         return analysis
     
+    def _local_analysis(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Analyze the stage from the incremental flags, or None if ambiguous."""
+        idx = self._tracked_index(conversation_id)
+        if idx is None:
+            return None
+        return self.ai_service.analysis_from_flags(self.store.extra[idx]["features"])
+    
+    async def analyze_many(self, conversation_ids: List[str], concurrency: int = 10) -> Dict[str, Dict[str, Any]]:
+        """Analyze many conversations concurrently, with at most `concurrency` requests in flight."""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _analyze_one(conversation_id: str) -> Dict[str, Any]:
+            messages = self.get_conversation(conversation_id)
+            if not messages:
+                return {"error": "Conversation not found"}
+            
+            analysis = self._local_analysis(conversation_id)
+            if analysis is None:
+                async with semaphore:
+                    analysis = await self.ai_service.aanalyze_conversation_stage(
+                        messages, self.store.history[self.store.index[conversation_id]]
+                    )
+            
+            self._record_analysis(conversation_id, analysis)
+            return analysis
+        
+        analyses = await asyncio.gather(*[_analyze_one(conv_id) for conv_id in conversation_ids])
+        return dict(zip(conversation_ids, analyses))
+    
+    def _record_analysis(self, conversation_id: str, analysis: Dict[str, Any]) -> None:
+        """Update conversation metadata with an analysis result."""
+        idx = self._tracked_index(conversation_id)
+        if idx is not None:
+            self.store.stage[idx] = analysis.get("stage", "unknown")
+            self.store.extra[idx]["analysis"] = analysis
+            self._publish_metadata(idx)
+    
+    def _mark_processed(self, conversation_id: str, extracted_clients: List[Client]) -> None:
+        """Record extracted clients and flag the conversation as processed."""
+        idx = self._tracked_index(conversation_id)
+        if idx is not None:
+            self.store.extra[idx]["extracted_clients"] = extracted_clients
+            self.store.processed[idx] = True
+            self._publish_metadata(idx)
+    
     def should_extract_data(self, conversation_id: str) -> bool:
         """Determine if conversation is ready for data extraction."""
-        messages = self.get_conversation(conversation_id)
-        metadata = self.get_conversation_metadata(conversation_id)
-        
-        if not messages or not metadata:
+        self._sync(conversation_id)
+        idx = self._tracked_index(conversation_id)
+        if idx is None:
             return False
         
         # Don't extract if already processed
-        if metadata.get("processed", False):
+        if self.store.processed[idx]:
             return False
         
         # Extract if conversation has enough exchanges and contains essential contact info
-        if len(messages) >= 8:  # Increased threshold for more complete conversations
-            # Check if conversation contains essential information
-            conversation_text = " ".join([msg.content.lower() for msg in messages])
+        if len(self.store.messages[idx]) >= 8:  # Increased threshold for more complete conversations
+            features = self.store.extra[idx]["features"]
             
             # Check for required fields
-            has_email = "@" in conversation_text and "." in conversation_text
-            has_phone = any(char.isdigit() for char in conversation_text) and len([c for c in conversation_text if c.isdigit()]) >= 10
-            has_name = any(word in conversation_text for word in ["name", "i'm", "i am", "call me", "my name"])
-            has_client_type = any(word in conversation_text for word in ["buy", "sell", "buyer", "seller", "buying", "selling"])
-            
-            # For sellers, check for address
-            has_address = False
-            if "sell" in conversation_text:
-                has_address = any(word in conversation_text for word in ["address", "street", "road", "avenue", "drive", "lane", "boulevard"])
+            has_email = features["has_at"] and features["has_dot"]
+            has_phone = features["digit_count"] >= 10
             
-            # For buyers, check for area/preferences
-            has_preferences = False
-            if "buy" in conversation_text:
-                has_preferences = any(word in conversation_text for word in ["area", "neighborhood", "budget", "price", "looking", "house", "apartment", "condo"])
+            # Sellers need an address, buyers need area/preferences
+            has_address = features["sell_hit"] and features["addr_hit"]
+            has_preferences = features["buy_hit"] and features["pref_hit"]
             
             # Require all essential fields
-            essential_complete = has_email and has_phone and has_name and has_client_type
+            essential_complete = has_email and has_phone and features["name_hit"] and features["type_hit"]
             context_complete = has_address or has_preferences
             
             return essential_complete and context_complete
@@ -132,9 +319,7 @@ class ConversationManager:
                 }
             
             # Update conversation metadata
-            if conversation_id in self.conversation_metadata:
-                self.conversation_metadata[conversation_id]["extracted_clients"] = extracted_clients
-                self.conversation_metadata[conversation_id]["processed"] = True
+            self._mark_processed(conversation_id, extracted_clients)
             
             # Save conversation to database
             self._save_conversation_to_db(conversation_id, messages, extracted_clients)
@@ -156,6 +341,35 @@ class ConversationManager:
                 "errors": [error_msg]
             }
     
+    def process_pending_extractions(self) -> Dict[str, List[Client]]:
+        """Extract client data for all eligible conversations in one batch job.
+        
+        For non-interactive use (e.g. scheduled lead extraction); live chat
+        turns keep using extract_and_process_clients.
+        """
+        pending_ids = [
+            # Copied because syncing swap-removes expired conversations from the store
+            conv_id for conv_id in list(self.store.ids)
+            if self.should_extract_data(conv_id)
+        ]
+        if not pending_ids:
+            return {}
+        
+        batch_results = self.ai_service.extract_client_data_batch(
+            [self.get_conversation(conv_id) for conv_id in pending_ids]
+        )
+        
+        processed: Dict[str, List[Client]] = {}
+        for conv_id, extracted_clients in zip(pending_ids, batch_results):
+            if not extracted_clients:
+                continue
+            
+            self._mark_processed(conv_id, extracted_clients)
+            self._save_conversation_to_db(conv_id, self.get_conversation(conv_id) or [], extracted_clients)
+            processed[conv_id] = extracted_clients
+        
+        return processed
+    
     def _save_conversation_to_db(self, conversation_id: str, messages: List[ChatMessage], clients: List[Client]) -> None:
         """Save conversation and client data to database."""
         try:
@@ -168,55 +382,78 @@ class ConversationManager:
             # Save conversation
             self.db_manager.save_conversation(conversation_id, messages_dict, client_email)
             
-            # Save interaction data for each client
-            for client in clients:
-                interaction_data = {
-                    "conversation_id": conversation_id,
-                    "messages": messages_dict,
-                    "extracted_at": datetime.now().isoformat()
-                }
-                self.db_manager.save_interaction(client.email, str(interaction_data))
+            # Save interaction data for each client (the payload is the same for all of them)
+            interaction_json = orjson.dumps({
+                "conversation_id": conversation_id,
+                "messages": messages_dict,
+                "extracted_at": datetime.now().isoformat()
+            }).decode()
+            self.db_manager.save_interactions([(client.email, interaction_json) for client in clients])
                 
         except Exception as e:
             print(f"Error saving conversation to database: {e}")
     
     def get_conversation_summary(self, conversation_id: str) -> Dict[str, Any]:
         """Get a summary of the conversation."""
-        messages = self.get_conversation(conversation_id)
-        metadata = self.get_conversation_metadata(conversation_id)
-        
-        if not messages or not metadata:
+        self._sync(conversation_id)
+        idx = self._tracked_index(conversation_id)
+        if idx is None or not self.store.messages[idx]:
             return {"error": "Conversation not found"}
         
+        return self._summary_at(idx)
+    
+    def _summary_at(self, idx: int) -> Dict[str, Any]:
+        """Build the summary for the conversation stored at a row index."""
+        store = self.store
+        messages = store.messages[idx]
         return {
-            "conversation_id": conversation_id,
+            "conversation_id": store.ids[idx],
             "message_count": len(messages),
-            "stage": metadata.get("stage", "unknown"),
-            "created_at": metadata.get("created_at"),
-            "updated_at": metadata.get("updated_at"),
-            "processed": metadata.get("processed", False),
-            "clients_extracted": len(metadata.get("extracted_clients", [])),
+            "stage": store.stage[idx],
+            "created_at": store.created_at[idx],
+            "updated_at": store.updated_at[idx],
+            "processed": store.processed[idx],
+            "clients_extracted": len(store.extra[idx].get("extracted_clients", [])),
             "last_message": messages[-1] if messages else None
         }
     
-    def list_active_conversations(self) -> List[Dict[str, Any]]:
-        """List all active conversations with summaries."""
+    def list_active_conversations(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """List active conversations with summaries, most recently updated first."""
+        if self.shared_store is not None:
+            # Every conversation is refreshed (in one round trip) since ordering depends on their update times
+            self._sync_many(list(set(self.shared_store.conversation_ids()) | set(self.store.ids)))
+        
+        # The store keeps conversations ordered by update time, so only the
+        # requested page is visited and summarized
+        store = self.store
         summaries = []
-        for conv_id in self.active_conversations.keys():
-            summary = self.get_conversation_summary(conv_id)
-            if "error" not in summary:
-                summaries.append(summary)
+        for _, conv_id in store.recent:
+            if limit is not None and len(summaries) >= limit:
+                break
+            idx = store.index[conv_id]
+            if store.created_at[idx] is not None and store.messages[idx]:
+                summaries.append(self._summary_at(idx))
+        
+        return summaries
+    
+    def count_active_conversations(self) -> int:
+        """Count the conversations list_active_conversations would return without a limit.
         
-        return sorted(summaries, key=lambda x: x.get("updated_at", x.get("created_at")), reverse=True)
+        Uses the local store as last refreshed, so call it after list_active_conversations.
+        """
+        store = self.store
+        return sum(
+            1 for created_at, messages in zip(store.created_at, store.messages)
+            if created_at is not None and messages
+        )
     
     def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation from memory and database."""
         try:
             # Remove from memory
-            if conversation_id in self.active_conversations:
-                del self.active_conversations[conversation_id]
-            if conversation_id in self.conversation_metadata:
-                del self.conversation_metadata[conversation_id]
+            self.store.remove(conversation_id)
+            if self.shared_store is not None:
+                self.shared_store.delete(conversation_id)
             
             # Remove from database
             return self.db_manager.delete_conversation(conversation_id)
@@ -226,21 +463,19 @@ class ConversationManager:
             return False
     
     def cleanup_old_conversations(self, max_age_hours: int = 24) -> int:
-        """Clean up old conversations from memory."""
-        current_time = datetime.now()
-        conversations_to_remove = []
+        """Clean up old conversations from memory.
         
-        for conv_id, metadata in self.conversation_metadata.items():
-            created_at = metadata.get("created_at", current_time)
-            age_hours = (current_time - created_at).total_seconds() / 3600
-            
-            if age_hours > max_age_hours:
-                conversations_to_remove.append(conv_id)
+        Conversations in the shared store expire through their Redis TTL instead.
+        """
+        cutoff = time.monotonic() - max_age_hours * 3600
+        store = self.store
+        
+        conversations_to_remove = [
+            store.ids[idx] for idx, created_at_s in enumerate(store.created_at_s)
+            if created_at_s is not None and created_at_s < cutoff
+        ]
         
         for conv_id in conversations_to_remove:
-            if conv_id in self.active_conversations:
-                del self.active_conversations[conv_id]
-            if conv_id in self.conversation_metadata:
-                del self.conversation_metadata[conv_id]
+            store.remove(conv_id)
         
         return len(conversations_to_remove)
\ No newline at end of file
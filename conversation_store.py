@@ -0,0 +1,202 @@
+"""In-memory conversation storage for AIREA Real Estate Chatbot."""
+
+import orjson
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime
+from pydantic import BaseModel
+from sortedcontainers import SortedList
+from models import ChatMessage, Client
+
+class ConversationStore:
+    """Struct-of-arrays storage for active conversations.
+    
+    Each conversation occupies one row across parallel column lists, so scans
+    that touch every conversation (cleanup, listing) are single loops over a
+    contiguous column instead of per-conversation dict lookups.
+    
+    Not thread-safe: `remove` moves the last row into the freed slot, so a row
+    index held by another thread can silently point at a different conversation.
+    All access must happen on the event loop thread; the app never touches the
+    store from worker threads.
+    """
+    
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.messages: List[List[ChatMessage]] = []
+        # Messages pre-formatted as "User: ..."/"Assistant: ..." text, appended per message
+        self.history: List[str] = []
+        # None marks a conversation that received messages without being created here
+        self.created_at: List[Optional[datetime]] = []
+        # Monotonic creation time in seconds, used for age checks
+        self.created_at_s: List[Optional[float]] = []
+        self.updated_at: List[Optional[datetime]] = []
+        self.stage: List[str] = []
+        self.processed: List[bool] = []
+        # Rarely scanned fields (client_type, extracted_clients, features, analysis)
+        self.extra: List[Dict[str, Any]] = []
+        # (-updated_at timestamp, id) for every conversation with an update, most recent first
+        self.recent = SortedList()
+        self._recent_keys: Dict[str, Tuple[float, str]] = {}
+    
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self.index
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def add(self, conversation_id: str, created_at: Optional[datetime] = None,
+            created_at_s: Optional[float] = None, stage: str = "welcome",
+            extra: Optional[Dict[str, Any]] = None) -> int:
+        """Append a conversation row and return its index."""
+        idx = len(self.ids)
+        self.index[conversation_id] = idx
+        self.ids.append(conversation_id)
+        self.messages.append([])
+        self.history.append("")
+        self.created_at.append(created_at)
+        self.created_at_s.append(created_at_s)
+        self.updated_at.append(None)
+        self.stage.append(stage)
+        self.processed.append(False)
+        self.extra.append(extra if extra is not None else {})
+        return idx
+    
+    def append_messages(self, idx: int, messages: List[ChatMessage], formatted: str) -> None:
+        """Append messages together with their pre-formatted history text."""
+        self.messages[idx].extend(messages)
+        self.history[idx] += formatted
+    
+    def set_updated_at(self, idx: int, updated_at: Optional[datetime]) -> None:
+        """Set a conversation's update time, keeping the recency order in sync."""
+        conversation_id = self.ids[idx]
+        self.updated_at[idx] = updated_at
+        
+        old_key = self._recent_keys.pop(conversation_id, None)
+        if old_key is not None:
+            self.recent.remove(old_key)
+        if updated_at is not None:
+            new_key = (-updated_at.timestamp(), conversation_id)
+            self.recent.add(new_key)
+            self._recent_keys[conversation_id] = new_key
+    
+    def get_index(self, conversation_id: str) -> Optional[int]:
+        """Get the row index of a conversation."""
+        return self.index.get(conversation_id)
+    
+    def remove(self, conversation_id: str) -> bool:
+        """Remove a conversation by moving the last row into its slot."""
+        idx = self.index.pop(conversation_id, None)
+        if idx is None:
+            return False
+        
+        recent_key = self._recent_keys.pop(conversation_id, None)
+        if recent_key is not None:
+            self.recent.remove(recent_key)
+        
+        last = len(self.ids) - 1
+        columns = (self.ids, self.messages, self.history, self.created_at, self.created_at_s,
+                   self.updated_at, self.stage, self.processed, self.extra)
+        if idx != last:
+            for column in columns:
+                column[idx] = column[last]
+            self.index[self.ids[idx]] = idx
+        for column in columns:
+            column.pop()
+        return True
+
+def _json_default(value: Any) -> Any:
+    """Serialize pydantic models stored in conversation metadata."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class RedisConversationStore:
+    """Shared conversation storage in Redis, so any worker can serve any turn.
+    
+    Messages are kept in a list at ``conv:{id}:msgs`` and metadata in a hash at
+    ``conv:{id}:meta``; both expire ``ttl_seconds`` after the last write, which
+    replaces in-process cleanup of old conversations.
+    """
+    
+    def __init__(self, url: str, ttl_seconds: int = 24 * 3600):
+        # Imported here so in-memory deployments do not need the redis package
+        import redis
+        
+        self.redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(url))
+        self.ttl_seconds = ttl_seconds
+    
+    def _messages_key(self, conversation_id: str) -> str:
+        return f"conv:{conversation_id}:msgs"
+    
+    def _meta_key(self, conversation_id: str) -> str:
+        return f"conv:{conversation_id}:meta"
+    
+    def _encode_metadata(self, metadata: Dict[str, Any]) -> Dict[str, bytes]:
+        return {key: orjson.dumps(value, default=_json_default) for key, value in metadata.items()}
+    
+    def _decode_metadata(self, raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+        metadata = {key.decode(): orjson.loads(value) for key, value in raw.items()}
+        for key in ("created_at", "updated_at"):
+            if metadata.get(key):
+                metadata[key] = datetime.fromisoformat(metadata[key])
+        if metadata.get("extracted_clients"):
+            metadata["extracted_clients"] = [Client.model_validate(c) for c in metadata["extracted_clients"]]
+        return metadata
+    
+    def _write(self, conversation_id: str, message: Optional[ChatMessage], metadata: Optional[Dict[str, Any]]) -> None:
+        """Write a message and/or metadata and refresh the TTL in one round trip."""
+        pipe = self.redis.pipeline(transaction=False)
+        if message is not None:
+            pipe.rpush(self._messages_key(conversation_id), orjson.dumps(message.model_dump()))
+            pipe.expire(self._messages_key(conversation_id), self.ttl_seconds)
+        if metadata is not None:
+            pipe.hset(self._meta_key(conversation_id), mapping=self._encode_metadata(metadata))
+            pipe.expire(self._meta_key(conversation_id), self.ttl_seconds)
+        pipe.execute()
+    
+    def save_metadata(self, conversation_id: str, metadata: Dict[str, Any]) -> None:
+        """Create or update a conversation's metadata."""
+        self._write(conversation_id, None, metadata)
+    
+    def append_message(self, conversation_id: str, message: ChatMessage, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Append a message, updating metadata in the same round trip."""
+        self._write(conversation_id, message, metadata)
+    
+    def load(self, conversation_id: str, start: int = 0) -> Optional[Tuple[List[ChatMessage], Optional[Dict[str, Any]]]]:
+        """Load messages from index `start` onwards plus metadata, or None if unknown.
+        
+        Messages are append-only, so callers holding the first `start` messages
+        only need to fetch the new ones.
+        """
+        return self.load_many([(conversation_id, start)])[0]
+    
+    def load_many(self, requests: List[Tuple[str, int]]) -> List[Optional[Tuple[List[ChatMessage], Optional[Dict[str, Any]]]]]:
+        """Like `load` for several (conversation_id, start) pairs, in one round trip."""
+        pipe = self.redis.pipeline(transaction=False)
+        for conversation_id, start in requests:
+            pipe.exists(self._messages_key(conversation_id), self._meta_key(conversation_id))
+            pipe.lrange(self._messages_key(conversation_id), start, -1)
+            pipe.hgetall(self._meta_key(conversation_id))
+        replies = pipe.execute()
+        
+        results = []
+        for i in range(0, len(replies), 3):
+            exists, raw_messages, raw_metadata = replies[i:i + 3]
+            if not exists:
+                results.append(None)
+                continue
+            messages = [ChatMessage.model_validate(orjson.loads(raw)) for raw in raw_messages]
+            results.append((messages, self._decode_metadata(raw_metadata) if raw_metadata else None))
+        return results
+    
+    def conversation_ids(self) -> List[str]:
+        """List the IDs of all stored conversations."""
+        return [
+            key.decode()[len("conv:"):-len(":msgs")]
+            for key in self.redis.scan_iter(match="conv:*:msgs", count=1000)
+        ]
+    
+    def delete(self, conversation_id: str) -> bool:
+        """Delete a conversation, returning whether it existed."""
+        return self.redis.delete(self._messages_key(conversation_id), self._meta_key(conversation_id)) > 0
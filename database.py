@@ -1,75 +1,320 @@
 """Database management for AIREA Real Estate Chatbot."""
 
 import sqlite3
-import json
-from typing import List, Dict, Any, Optional
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from models import Client
 
+# Per-connection tuning; WAL lets readers run alongside the writer and
+# synchronous=NORMAL is durable under WAL with one fsync per checkpoint
+SESSION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+# Rows pulled per fetchmany call when reading whole tables
+FETCH_BATCH_SIZE = 512
+
+# Emails per IN (...) lookup, well under SQLite's bound-parameter limit
+CLIENT_LOOKUP_CHUNK_SIZE = 500
+
+# Every statement the module runs, kept as constants so each connection's
+# statement cache (sized well above this count) always hits
+_SQL_CREATE_CLIENTS = '''
+    CREATE TABLE IF NOT EXISTS clients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_type TEXT NOT NULL,
+        name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        property_type TEXT,
+        address TEXT,
+        budget REAL,
+        appointment BOOLEAN,
+        appointment_time TEXT,
+        details TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+_SQL_CREATE_INTERACTIONS = '''
+    CREATE TABLE IF NOT EXISTS interactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_email TEXT NOT NULL,
+        interaction_data TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (client_email) REFERENCES clients(email)
+    )
+'''
+
+_SQL_CREATE_CONVERSATIONS = '''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id TEXT UNIQUE NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        client_email TEXT,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# One row per message, so saving a conversation only inserts what is new
+_SQL_CREATE_CONVERSATION_MESSAGES = '''
+    CREATE TABLE IF NOT EXISTS conversation_messages (
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (conversation_id, seq)
+    )
+'''
+
+# Moves messages out of the JSON column used by databases created before conversation_messages
+_SQL_MIGRATE_CONVERSATION_MESSAGES = (
+    '''
+    INSERT OR IGNORE INTO conversation_messages (conversation_id, seq, role, content)
+    SELECT c.conversation_id, CAST(m.key AS INTEGER),
+        COALESCE(json_extract(m.value, '$.role'), ''),
+        COALESCE(json_extract(m.value, '$.content'), '')
+    FROM conversations c, json_each(c.messages) m
+    ''',
+    "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+    "UPDATE conversations SET message_count = json_array_length(messages)",
+    "ALTER TABLE conversations DROP COLUMN messages",
+)
+
+# Secondary indexes; clients.email and conversations.conversation_id are
+# already indexed by their UNIQUE constraints
+_SQL_CREATE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_interactions_email ON interactions(client_email)",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_client ON conversations(client_email)",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at DESC)",
+)
+
+_SQL_UPSERT_CLIENT = '''
+    INSERT INTO clients (
+        client_type, name, phone, email, property_type,
+        address, budget, appointment, appointment_time, details
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(email) DO UPDATE SET
+        client_type = excluded.client_type,
+        name = excluded.name,
+        phone = excluded.phone,
+        property_type = excluded.property_type,
+        address = excluded.address,
+        budget = excluded.budget,
+        appointment = excluded.appointment,
+        appointment_time = excluded.appointment_time,
+        details = excluded.details,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+_SQL_INSERT_INTERACTION = '''
+    INSERT INTO interactions (client_email, interaction_data)
+    VALUES (?, ?)
+'''
+
+# message_count is left untouched on conflict so RETURNING reports how many messages are already stored
+_SQL_UPSERT_CONVERSATION = '''
+    INSERT INTO conversations (conversation_id, client_email)
+    VALUES (?, ?)
+    ON CONFLICT(conversation_id) DO UPDATE SET
+        client_email = excluded.client_email,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING message_count
+'''
+
+_SQL_SET_MESSAGE_COUNT = "UPDATE conversations SET message_count = ? WHERE conversation_id = ?"
+
+_SQL_INSERT_MESSAGE = '''
+    INSERT INTO conversation_messages (conversation_id, seq, role, content)
+    VALUES (?, ?, ?, ?)
+'''
+
+_SQL_GET_MESSAGE = "SELECT role, content FROM conversation_messages WHERE conversation_id = ? AND seq = ?"
+
+_SQL_GET_MESSAGES = "SELECT role, content FROM conversation_messages WHERE conversation_id = ? ORDER BY seq"
+
+_SQL_CLIENT_EXISTS = "SELECT 1 FROM clients WHERE email = ? LIMIT 1"
+
+# Returns a row only when the client was inserted; an existing email falls through to the upsert
+_SQL_INSERT_NEW_CLIENT = '''
+    INSERT INTO clients (
+        client_type, name, phone, email, property_type,
+        address, budget, appointment, appointment_time, details
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(email) DO NOTHING
+    RETURNING 1
+'''
+
+# Placeholders are appended per chunk by save_clients
+_SQL_EXISTING_CLIENT_EMAILS = "SELECT email FROM clients WHERE email IN "
+
+_SQL_GET_ALL_CLIENTS = "SELECT * FROM clients ORDER BY created_at DESC"
+
+_SQL_GET_CLIENT = "SELECT * FROM clients WHERE email = ?"
+
+_SQL_GET_CONVERSATION = "SELECT * FROM conversations WHERE conversation_id = ?"
+
+# The last message is joined by its sequence number rather than loading whole conversations
+_SQL_GET_ALL_CONVERSATIONS = '''
+    SELECT c.*, m.role AS last_role, m.content AS last_content
+    FROM conversations c
+    LEFT JOIN conversation_messages m
+        ON m.conversation_id = c.conversation_id AND m.seq = c.message_count - 1
+    ORDER BY c.updated_at DESC
+'''
+
+_SQL_DELETE_CONVERSATION = "DELETE FROM conversations WHERE conversation_id = ? RETURNING 1"
+
+_SQL_DELETE_MESSAGES = "DELETE FROM conversation_messages WHERE conversation_id = ?"
+
+class _LRUCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
 class DatabaseManager:
-    """Manages database operations for clients and interactions."""
+    """Manages database operations for clients and interactions.
+    
+    Client and conversation lookups are cached in-process and invalidated by this
+    manager's writes; the TTL bounds staleness from writes made by other processes.
     
-    def __init__(self, db_path: str = 'real_estate_clients.db'):
+    With ``shared_cache`` the per-thread connections share one page cache instead of
+    each warming its own. Shared-cache connections lock at table level, so a thread
+    reading a table another thread is writing gets SQLITE_LOCKED ("database table is
+    locked") rather than a WAL snapshot; leave it off for write-heavy, many-threaded use.
+    """
+    
+    def __init__(self, db_path: str = 'real_estate_clients.db', cache_size: int = 1024,
+                 cache_ttl: float = 300.0, shared_cache: bool = False):
         self.db_path = db_path
+        self.shared_cache = shared_cache
+        self._client_cache = _LRUCache(cache_size, cache_ttl)
+        self._conversation_cache = _LRUCache(cache_size, cache_ttl)
+        # One long-lived connection per thread keeps the page and statement caches warm
+        self._tls = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        atexit.register(self.close)
         self.init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it with the session PRAGMAs on first use.
+        
+        Connections run in autocommit mode; writes open explicit transactions.
+        """
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            if self.shared_cache:
+                database, uri = f"file:{quote(self.db_path, safe='/:')}?cache=shared", True
+            else:
+                database, uri = self.db_path, False
+            conn = sqlite3.connect(
+                database,
+                uri=uri,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=256
+            )
+            conn.row_factory = sqlite3.Row
+            for pragma in SESSION_PRAGMAS:
+                conn.execute(pragma)
+            if self.shared_cache:
+                # Keep readers from seeing other connections' uncommitted writes through the shared cache
+                conn.execute("PRAGMA read_uncommitted=0")
+            self._tls.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def close(self) -> None:
+        """Close the connections opened by every thread."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Error closing database connection: {e}")
+        self._tls = threading.local()
+    
     def init_database(self) -> None:
         """Initialize the database and create tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._connect()
+        # Journal mode is stored in the database file, so set it once here
+        conn.execute("PRAGMA journal_mode=WAL")
+        
+        conn.execute("BEGIN IMMEDIATE")
+        try:
             cursor = conn.cursor()
             
             # Create clients table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS clients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    client_type TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    property_type TEXT,
-                    address TEXT,
-                    budget REAL,
-                    appointment BOOLEAN,
-                    appointment_time TEXT,
-                    details TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            cursor.execute(_SQL_CREATE_CLIENTS)
             
             # Create interactions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    client_email TEXT NOT NULL,
-                    interaction_data TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (client_email) REFERENCES clients(email)
-                )
-            ''')
+            cursor.execute(_SQL_CREATE_INTERACTIONS)
             
             # Create conversations table for better conversation management
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    conversation_id TEXT UNIQUE NOT NULL,
-                    messages TEXT NOT NULL,
-                    client_email TEXT,
-                    status TEXT DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            cursor.execute(_SQL_CREATE_CONVERSATIONS)
+            cursor.execute(_SQL_CREATE_CONVERSATION_MESSAGES)
+            
+            # Older databases kept each conversation's messages as one JSON column
+            columns = {row["name"] for row in cursor.execute("PRAGMA table_info(conversations)")}
+            if "messages" in columns:
+                for statement in _SQL_MIGRATE_CONVERSATION_MESSAGES:
+                    cursor.execute(statement)
+            
+            # Index lookup columns and the conversation listing order
+            for statement in _SQL_CREATE_INDEXES:
+                cursor.execute(statement)
             
-            conn.commit()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.rollback()
+            raise
     
     def client_exists(self, email: str) -> bool:
         """Check if a client already exists in the database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM clients WHERE email = ?', (email,))
-            count = cursor.fetchone()[0]
-            return count > 0
+        cursor = self._connect().cursor()
+        cursor.execute(_SQL_CLIENT_EXISTS, (email,))
+        return cursor.fetchone() is not None
     
     def save_client(self, client_data: Client) -> bool:
         """Save or update client data in the database.
@@ -77,177 +322,229 @@ class DatabaseManager:
         Returns:
             bool: True if new client was created, False if existing client was updated
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        # Bind parameters are built before taking the write lock to keep the transaction short
+        params = client_data.as_db_row()
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # An upsert cannot report whether it inserted, so try a plain insert first:
+            # new clients take one statement, and existing ones are then updated
+            cursor.execute(_SQL_INSERT_NEW_CLIENT, params)
+            is_new = cursor.fetchone() is not None
+            if not is_new:
+                cursor.execute(_SQL_UPSERT_CLIENT, params)
             
-            try:
-                appointment_time_str = (
-                    client_data.appointment_time.isoformat() 
-                    if client_data.appointment_time else None
-                )
-                
-                if self.client_exists(client_data.email):
-                    # Update existing client
-                    cursor.execute('''
-                        UPDATE clients SET
-                            client_type = ?,
-                            name = ?,
-                            phone = ?,
-                            property_type = ?,
-                            address = ?,
-                            budget = ?,
-                            appointment = ?,
-                            appointment_time = ?,
-                            details = ?,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE email = ?
-                    ''', (
-                        client_data.client_type,
-                        client_data.name,
-                        client_data.phone,
-                        client_data.property_type,
-                        client_data.address,
-                        client_data.budget,
-                        client_data.appointment,
-                        appointment_time_str,
-                        client_data.details,
-                        client_data.email
-                    ))
-                    is_new = False
-                else:
-                    # Insert new client
-                    cursor.execute('''
-                        INSERT INTO clients (
-                            client_type, name, phone, email, property_type,
-                            address, budget, appointment, appointment_time, details
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        client_data.client_type,
-                        client_data.name,
-                        client_data.phone,
-                        client_data.email,
-                        client_data.property_type,
-                        client_data.address,
-                        client_data.budget,
-                        client_data.appointment,
-                        appointment_time_str,
-                        client_data.details
-                    ))
-                    is_new = True
-                
-                conn.commit()
-                return is_new
-                
-            except Exception as e:
-                print(f"Database error saving client: {e}")
-                conn.rollback()
-                raise
+            conn.execute("COMMIT")
+            self._client_cache.pop(client_data.email)
+            return is_new
+            
+        except Exception as e:
+            print(f"Database error saving client: {e}")
+            conn.rollback()
+            raise
+    
+    def save_clients(self, clients: List[Client]) -> List[bool]:
+        """Save or update several clients in one transaction.
+        
+        Returns:
+            List[bool]: For each client, True if it was created, False if it was updated
+        """
+        if not clients:
+            return []
+        
+        rows = [client_data.as_db_row() for client_data in clients]
+        emails = list(dict.fromkeys(client_data.email for client_data in clients))
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = set()
+            for start in range(0, len(emails), CLIENT_LOOKUP_CHUNK_SIZE):
+                chunk = emails[start:start + CLIENT_LOOKUP_CHUNK_SIZE]
+                placeholders = "(" + ", ".join("?" * len(chunk)) + ")"
+                cursor.execute(_SQL_EXISTING_CLIENT_EMAILS + placeholders, chunk)
+                existing.update(row["email"] for row in cursor.fetchall())
+            
+            cursor.executemany(_SQL_UPSERT_CLIENT, rows)
+            conn.execute("COMMIT")
+        except Exception as e:
+            print(f"Database error saving clients: {e}")
+            conn.rollback()
+            raise
+        
+        for email in emails:
+            self._client_cache.pop(email)
+        
+        # A repeated email is new only at its first occurrence
+        is_new = []
+        for client_data in clients:
+            is_new.append(client_data.email not in existing)
+            existing.add(client_data.email)
+        return is_new
     
     def get_all_clients(self) -> List[Dict[str, Any]]:
         """Get all clients from the database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM clients ORDER BY created_at DESC')
-            columns = [description[0] for description in cursor.description]
-            clients = [dict(zip(columns, row)) for row in cursor.fetchall()]
-            return clients
+        cursor = self._connect().cursor()
+        cursor.execute(_SQL_GET_ALL_CLIENTS)
+        clients = []
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                return clients
+            clients.extend(dict(row) for row in rows)
     
     def get_client_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get a specific client by email."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM clients WHERE email = ?', (email,))
+        client = self._client_cache.get(email)
+        if client is None:
+            cursor = self._connect().cursor()
+            cursor.execute(_SQL_GET_CLIENT, (email,))
             row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            if row is None:
+                return None
+            client = dict(row)
+            self._client_cache.put(email, client)
+        # Copy so callers cannot modify the cached entry
+        return dict(client)
     
     def save_interaction(self, email: str, interaction_data: str) -> None:
         """Save conversation history for a client."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute('''
-                    INSERT INTO interactions (client_email, interaction_data)
-                    VALUES (?, ?)
-                ''', (email, interaction_data))
-                conn.commit()
-            except Exception as e:
-                print(f"Error saving interaction: {e}")
-                conn.rollback()
-                raise
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor.execute(_SQL_INSERT_INTERACTION, (email, interaction_data))
+            conn.execute("COMMIT")
+        except Exception as e:
+            print(f"Error saving interaction: {e}")
+            conn.rollback()
+            raise
+    
+    def save_interactions(self, rows: List[Tuple[str, str]]) -> None:
+        """Save several (email, interaction_data) rows in one transaction."""
+        if not rows:
+            return
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor.executemany(_SQL_INSERT_INTERACTION, rows)
+            conn.execute("COMMIT")
+        except Exception as e:
+            print(f"Error saving interactions: {e}")
+            conn.rollback()
+            raise
     
     def save_conversation(self, conversation_id: str, messages: List[Dict], client_email: Optional[str] = None) -> None:
-        """Save or update conversation in database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        """Save or update conversation in database.
+        
+        Messages are append-only, so when the last stored message still matches only those
+        past the stored message count are inserted; otherwise every message is rewritten.
+        """
+        message_rows = [
+            (conversation_id, seq, message["role"], message["content"])
+            for seq, message in enumerate(messages)
+        ]
+        
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor.execute(_SQL_UPSERT_CONVERSATION, (conversation_id, client_email))
+            stored_count = cursor.fetchone()["message_count"]
             
-            try:
-                messages_json = json.dumps(messages)
-                
-                # Check if conversation exists
-                cursor.execute('SELECT id FROM conversations WHERE conversation_id = ?', (conversation_id,))
-                exists = cursor.fetchone()
-                
-                if exists:
-                    # Update existing conversation
-                    cursor.execute('''
-                        UPDATE conversations SET
-                            messages = ?,
-                            client_email = ?,
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE conversation_id = ?
-                    ''', (messages_json, client_email, conversation_id))
-                else:
-                    # Insert new conversation
-                    cursor.execute('''
-                        INSERT INTO conversations (conversation_id, messages, client_email)
-                        VALUES (?, ?, ?)
-                    ''', (conversation_id, messages_json, client_email))
-                
-                conn.commit()
-            except Exception as e:
-                print(f"Error saving conversation: {e}")
-                conn.rollback()
-                raise
+            if stored_count == 0 or self._extends_stored(cursor, conversation_id, message_rows, stored_count):
+                cursor.executemany(_SQL_INSERT_MESSAGE, message_rows[stored_count:])
+            else:
+                # Shortened, or a reused conversation_id whose history differs; the stored rows can't be trusted
+                cursor.execute(_SQL_DELETE_MESSAGES, (conversation_id,))
+                cursor.executemany(_SQL_INSERT_MESSAGE, message_rows)
+            if len(messages) != stored_count:
+                cursor.execute(_SQL_SET_MESSAGE_COUNT, (len(messages), conversation_id))
+            
+            conn.execute("COMMIT")
+            self._conversation_cache.pop(conversation_id)
+        except Exception as e:
+            print(f"Error saving conversation: {e}")
+            conn.rollback()
+            raise
+    
+    @staticmethod
+    def _extends_stored(cursor: sqlite3.Cursor, conversation_id: str, message_rows: List[Tuple], stored_count: int) -> bool:
+        """Whether message_rows only appends to the stored messages, judged by the last stored row."""
+        if len(message_rows) <= stored_count:
+            return False
+        cursor.execute(_SQL_GET_MESSAGE, (conversation_id, stored_count - 1))
+        last = cursor.fetchone()
+        return last is not None and (last["role"], last["content"]) == message_rows[stored_count - 1][2:]
     
     def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get conversation by ID."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM conversations WHERE conversation_id = ?', (conversation_id,))
+        conversation = self._conversation_cache.get(conversation_id)
+        if conversation is None:
+            cursor = self._connect().cursor()
+            cursor.execute(_SQL_GET_CONVERSATION, (conversation_id,))
             row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                conversation = dict(zip(columns, row))
-                # Parse messages JSON
-                conversation['messages'] = json.loads(conversation['messages'])
-                return conversation
-            return None
+            if row is None:
+                return None
+            conversation = dict(row)
+            cursor.execute(_SQL_GET_MESSAGES, (conversation_id,))
+            conversation['messages'] = [dict(message) for message in cursor.fetchall()]
+            self._conversation_cache.put(conversation_id, conversation)
+        # Copy so callers cannot modify the cached entry
+        return {
+            **conversation,
+            'messages': [dict(message) for message in conversation['messages']]
+        }
+    
+    def iter_conversations(self) -> Iterator[Dict[str, Any]]:
+        """Yield conversation summaries, most recently updated first, without their full message lists.
+        
+        Rows are fetched in batches as the generator is consumed.
+        """
+        cursor = self._connect().cursor()
+        cursor.execute(_SQL_GET_ALL_CONVERSATIONS)
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                conversation = dict(row)
+                last_role = conversation.pop('last_role')
+                last_content = conversation.pop('last_content')
+                conversation['last_message'] = (
+                    {"role": last_role, "content": last_content} if last_role is not None else None
+                )
+                yield conversation
     
     def get_all_conversations(self) -> List[Dict[str, Any]]:
-        """Get all conversations."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM conversations ORDER BY updated_at DESC')
-            columns = [description[0] for description in cursor.description]
-            conversations = []
-            for row in cursor.fetchall():
-                conversation = dict(zip(columns, row))
-                # Parse messages JSON for summary
-                messages = json.loads(conversation['messages'])
-                conversation['message_count'] = len(messages)
-                conversation['last_message'] = messages[-1] if messages else None
-                conversations.append(conversation)
-            return conversations
+        """Get summaries of all conversations, without their full message lists."""
+        return list(self.iter_conversations())
     
     def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM conversations WHERE conversation_id = ?', (conversation_id,))
-            deleted = cursor.rowcount > 0
-            conn.commit()
-            return deleted
\ No newline at end of file
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor.execute(_SQL_DELETE_CONVERSATION, (conversation_id,))
+            deleted = cursor.fetchone() is not None
+            if deleted:
+                cursor.execute(_SQL_DELETE_MESSAGES, (conversation_id,))
+            conn.execute("COMMIT")
+            self._conversation_cache.pop(conversation_id)
+            return deleted
+        except Exception as e:
+            print(f"Error deleting conversation: {e}")
+            conn.rollback()
+            raise
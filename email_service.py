@@ -1,350 +1,527 @@
 """Email service for AIREA Real Estate Chatbot."""
 
 import re
-from typing import Dict, Any
+import html
+import asyncio
+import base64
+import functools
+import logging
+import queue
+import threading
+import uuid
+import weakref
+from dataclasses import dataclass
+from string import Template
+from typing import Dict, Any, Awaitable, List, Optional, Tuple, TypeVar
 from datetime import datetime
-from mailjet_rest import Client as MailjetClient
+from pathlib import Path
+import httpx
+import orjson
 from models import Client
 
+MAILJET_SEND_URL = "https://api.mailjet.com/v3.1/send"
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+
+# Connections are kept alive between sends so TCP and TLS handshakes are reused
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=50, keepalive_expiry=60.0)
+HTTP_TIMEOUT = httpx.Timeout(30.0)
+# Only failed connection attempts are retried, so a send Mailjet may have accepted is never repeated
+HTTP_CONNECT_RETRIES = 2
+# How long shutdown waits for the mail worker to finish queued jobs
+WORKER_STOP_TIMEOUT = 30.0
+# Throttled or unavailable sends, which Mailjet rejected outright, are retried with exponential
+# backoff honouring Retry-After; other 5xx may follow a partial accept, so they are never retried
+SEND_RETRY_STATUSES = frozenset({429, 503})
+SEND_RETRIES = 4
+SEND_BACKOFF = 0.5
+SEND_BACKOFF_MAX = 30.0
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+logger = logging.getLogger(__name__)
+
+# Used by _html_to_text; a greedy negated class needs no backtracking, and
+# template fields are HTML-escaped, so a literal '<' never starts a false tag
+TAG_PATTERN = re.compile(r'<[^>]*>')
+NBSP_TO_SPACE = str.maketrans({'\xa0': ' '})
+HTML_COMMENT_PATTERN = re.compile(r'<!--.*?-->', re.DOTALL)
+
+T = TypeVar("T")
+
+@dataclass
+class LeadJob:
+    """A lead's emails waiting for the background mail worker."""
+    job_id: str
+    client_data: Client
+    is_new_client: bool
+    processing_method: str
+
+def _minify_html(markup: str) -> str:
+    """Drop comments, indentation and blank lines from static template markup.
+    
+    Line breaks are kept, so no two words or inline elements are ever joined.
+    """
+    lines = (line.strip() for line in HTML_COMMENT_PATTERN.sub('', markup).splitlines())
+    return "\n".join(line for line in lines if line)
+
+# Email templates are parsed and minified once at import; client fields are HTML-escaped before substitution
+DETAIL_ROW = '<p style="margin: 5px 0; color: #333;"><strong>{label}:</strong> {value}</p>'
+
+NOTE_BOX = '<div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;"><h4 style="color: #111827; margin-top: 0;">{title}:</h4><p style="color: #333; margin-bottom: 0;">{value}</p></div>'
+
+# Shared by the client information and requirements sections of every email
+INFO_BOX = Template(_minify_html("""<div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
+                        <h3 style="color: #111827; margin-top: 0; margin-bottom: 15px;">$title:</h3>
+                        $rows
+                    </div>"""))
+
+APPOINTMENT_BOX = Template(_minify_html("""
+                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
+                        <h3 style="color: #111827; margin-top: 0;">Appointment Scheduled</h3>
+                        <p style="margin: 5px 0; color: #333;"><strong>Date & Time:</strong> $appointment_time</p>
+                        $location_row
+                    </div>
+"""))
+
+def _load_template(name: str) -> Template:
+    """Read an email template from the templates directory, minifying HTML ones."""
+    source = (TEMPLATE_DIR / name).read_text(encoding="utf-8")
+    return Template(_minify_html(source) if name.endswith(".html") else source)
+
+EMAIL_LAYOUT = _load_template("layout.html")
+WELCOME_BODY = _load_template("welcome.html")
+WELCOME_TEXT = _load_template("welcome.txt")
+PROPERTY_BODY = _load_template("property.html")
+PROPERTY_TEXT = _load_template("property.txt")
+AGENT_BODY = _load_template("agent.html")
+AGENT_TEXT = _load_template("agent.txt")
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying a throttled or failed send."""
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), SEND_BACKOFF_MAX)
+    return min(SEND_BACKOFF * 2 ** attempt, SEND_BACKOFF_MAX)
+
+def _detail_row(label: str, value: Any) -> str:
+    """Render a labelled detail line, or nothing when the value is missing."""
+    return DETAIL_ROW.format(label=label, value=html.escape(str(value))) if value else ''
+
+def _info_box(title: str, rows: List[Tuple[str, Any]]) -> str:
+    """Render a titled box of (label, value) detail rows, skipping missing values."""
+    rendered = [_detail_row(label, value) for label, value in rows]
+    return INFO_BOX.substitute(title=title, rows="\n".join(row for row in rendered if row))
+
+def _format_budget(budget: Optional[float]) -> Optional[str]:
+    return f"${budget:,.2f}" if budget else None
+
+@functools.lru_cache(maxsize=1024)
+def _format_appointment(appointment_time: datetime) -> str:
+    """Format an appointment time; cached since a lead's emails all show the same one."""
+    return appointment_time.strftime('%B %d, %Y at %I:%M %p')
+
+def _appointment_time(client_data: Client) -> Optional[str]:
+    if not (client_data.appointment and client_data.appointment_time):
+        return None
+    return _format_appointment(client_data.appointment_time)
+
+def _appointment_section(appointment_time: Optional[str], location_label: str, address: Optional[str]) -> str:
+    """Render the appointment box for clients with a scheduled appointment."""
+    if not appointment_time:
+        return ''
+    return APPOINTMENT_BOX.substitute(
+        appointment_time=appointment_time,
+        location_row=_detail_row(location_label, address)
+    )
+
+def _notes_section(title: str, details: Optional[str]) -> str:
+    return NOTE_BOX.format(title=title, value=html.escape(details)) if details else ''
+
+def _text_section(title: str, body: Optional[str]) -> str:
+    """Render a titled plain-text section followed by a blank line, or nothing when empty."""
+    return f"{title}:\n{body}\n\n" if body else ''
+
+def _text_rows(title: str, rows: List[Tuple[str, Any]]) -> str:
+    """Plain-text counterpart of `_info_box`."""
+    return _text_section(title, "\n".join(f"- {label}: {value}" for label, value in rows if value))
+
+def _appointment_text(appointment_time: Optional[str], location_label: str, address: Optional[str]) -> str:
+    """Plain-text counterpart of `_appointment_section`."""
+    if not appointment_time:
+        return ''
+    return _text_rows("Appointment Scheduled", [
+        ("Date & Time", appointment_time),
+        (location_label, address)
+    ])
+
 class MailjetEmailService:
-    """Email service using Mailjet API."""
+    """Email service using Mailjet API.
+    
+    Sending is async; synchronous callers outside an event loop can use `run_sync`.
+    Lead emails are queued in memory for a background worker thread; `close` lets it
+    finish queued jobs, but jobs still queued if the process exits without it are not sent.
+    """
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self.client = None
+        # Sender and agent addresses are read on every message, so keep them as attributes
+        self.sender_email: str = config['sender_email']
+        self.sender_name: str = config['sender_name']
+        self.agent_email: Optional[str] = config.get('agent_email')
+        self._sender_email_html = html.escape(self.sender_email)
+        # Shared by every message built here; messages are only serialized, never mutated
+        self._sender = {"Email": self.sender_email, "Name": self.sender_name}
+        self.auth: Optional[Tuple[str, str]] = None
+        self._headers: Dict[str, str] = dict(JSON_HEADERS)
+        # One HTTP client per event loop, since pooled connections are bound to the loop that opened them
+        self._http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        # None tells the worker to stop
+        self._queue: "queue.Queue[Optional[LeadJob]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
         
-        # Initialize Mailjet client if credentials are available
+        # Keep Mailjet credentials if they are available
         if config['mailjet_api_key'] and config['mailjet_secret_key']:
-            self.client = MailjetClient(
-                auth=(config['mailjet_api_key'], config['mailjet_secret_key']),
-                version='v3.1'
-            )
+            self.auth = (config['mailjet_api_key'], config['mailjet_secret_key'])
+            # Every send carries the same headers, so the Basic auth value is encoded once here
+            credentials = base64.b64encode(f"{self.auth[0]}:{self.auth[1]}".encode()).decode()
+            self._headers = {**JSON_HEADERS, "Authorization": f"Basic {credentials}"}
         else:
-            print("Warning: Mailjet client not initialized due to missing credentials")
+            logger.warning("Mailjet client not initialized due to missing credentials")
     
     def is_configured(self) -> bool:
         """Check if email service is properly configured."""
-        return self.client is not None
+        return self.auth is not None
     
-    def send_email(self, to_email: str, to_name: str, subject: str, html_content: str, text_content: str = "") -> bool:
-        """Send an email using Mailjet API with detailed logging."""
-        if not self.client:
-            print("❌ Error: Mailjet client not initialized")
-            return False
+    def _http(self) -> httpx.AsyncClient:
+        """Get the HTTP client for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._http_clients.get(loop)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(limits=HTTP_LIMITS, retries=HTTP_CONNECT_RETRIES)
+            client = httpx.AsyncClient(headers=self._headers, transport=transport, timeout=HTTP_TIMEOUT)
+            self._http_clients[loop] = client
+        return client
+    
+    async def aclose(self) -> None:
+        """Close the HTTP client of the running event loop."""
+        client = self._http_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    async def close(self) -> None:
+        """Stop the mail worker once its queued jobs are sent, then close this loop's HTTP client."""
+        await asyncio.to_thread(self._stop_worker)
+        await self.aclose()
+    
+    def run_sync(self, awaitable: Awaitable[T]) -> T:
+        """Run one of the async send methods from synchronous code outside an event loop."""
+        async def run() -> T:
+            try:
+                return await awaitable
+            finally:
+                await self.aclose()
+        
+        return asyncio.run(run())
+    
+    def _build_message(self, to_email: str, to_name: str, subject: str, html_content: str, text_content: str = "") -> Dict[str, Any]:
+        """Build one entry of a Mailjet `Messages` array."""
+        return {
+            "From": self._sender,
+            "To": [
+                {
+                    "Email": to_email,
+                    "Name": to_name
+                }
+            ],
+            "Subject": subject,
+            "HTMLPart": html_content,
+            "TextPart": text_content or self._html_to_text(html_content)
+        }
+    
+    def _log_message(self, message: Dict[str, Any]) -> None:
+        """Log detailed email data before sending (debug level only)."""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        
+        recipient = message['To'][0]
+        text = message['TextPart']
+        text_length = len(text)
+        logger.debug(
+            "Sending email\n"
+            "  From: %s <%s>\n"
+            "  To: %s <%s>\n"
+            "  Subject: %s\n"
+            "  HTML length: %d characters\n"
+            "  Text length: %d characters\n"
+            "  Text preview: %s%s",
+            message['From']['Name'], message['From']['Email'],
+            recipient['Name'], recipient['Email'],
+            message['Subject'],
+            len(message['HTMLPart']),
+            text_length,
+            text[:300], '...' if text_length > 300 else ''
+        )
+    
+    async def send_messages(self, messages: List[Dict[str, Any]]) -> List[bool]:
+        """Send up to 50 messages in a single Mailjet request.
+        
+        Returns:
+            List[bool]: Whether each message was accepted, in the order given
+        """
+        if not self.auth:
+            logger.error("Mailjet client not initialized")
+            return [False] * len(messages)
         
         try:
-            data = {
-                'Messages': [
-                    {
-                        "From": {
-                            "Email": self.config['sender_email'],
-                            "Name": self.config['sender_name']
-                        },
-                        "To": [
-                            {
-                                "Email": to_email,
-                                "Name": to_name
-                            }
-                        ],
-                        "Subject": subject,
-                        "HTMLPart": html_content,
-                        "TextPart": text_content or self._html_to_text(html_content)
-                    }
-                ]
-            }
+            for message in messages:
+                self._log_message(message)
             
-            # Print detailed email data before sending
-            print("\n" + "="*70)
-            print("📧 SENDING EMAIL")
-            print("="*70)
-            print(f"📤 FROM: {self.config['sender_name']} <{self.config['sender_email']}>")
-            print(f"📥 TO: {to_name} <{to_email}>")
-            print(f"📋 SUBJECT: {subject}")
-            print(f"📄 HTML LENGTH: {len(html_content)} characters")
-            print(f"📝 TEXT LENGTH: {len(text_content or self._html_to_text(html_content))} characters")
-            print(f"⏰ TIMESTAMP: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print("-" * 70)
-            print("📄 TEXT CONTENT PREVIEW:")
-            preview_text = (text_content or self._html_to_text(html_content))[:300]
-            print(f"{preview_text}{'...' if len(preview_text) >= 300 else ''}")
-            print("-" * 70)
-            print("📊 EMAIL DATA STRUCTURE:")
-            print(f"   - Messages Count: {len(data['Messages'])}")
-            print(f"   - From Email: {data['Messages'][0]['From']['Email']}")
-            print(f"   - From Name: {data['Messages'][0]['From']['Name']}")
-            print(f"   - To Email: {data['Messages'][0]['To'][0]['Email']}")
-            print(f"   - To Name: {data['Messages'][0]['To'][0]['Name']}")
-            print(f"   - Subject: {data['Messages'][0]['Subject']}")
-            print(f"   - Has HTML: {'Yes' if data['Messages'][0]['HTMLPart'] else 'No'}")
-            print(f"   - Has Text: {'Yes' if data['Messages'][0]['TextPart'] else 'No'}")
-            print("="*70)
+            client = self._http()
+            body = self._encode_payload(messages)
+            for attempt in range(SEND_RETRIES + 1):
+                result = await client.post(MAILJET_SEND_URL, content=body)
+                if result.status_code not in SEND_RETRY_STATUSES or attempt == SEND_RETRIES:
+                    break
+                delay = _retry_delay(result, attempt)
+                logger.warning("Mailjet returned %s, retrying in %.1fs", result.status_code, delay)
+                await asyncio.sleep(delay)
+            response_data = orjson.loads(result.content)
             
-            result = self.client.send.create(data=data)
+            # Mailjet reports a status per message; a batch with any failure returns a non-200 code
+            statuses = response_data.get('Messages') or []
+            sent = [
+                i < len(statuses) and statuses[i].get('Status') == 'success'
+                for i in range(len(messages))
+            ]
             
             if result.status_code == 200:
-                print(f"✅ EMAIL SENT SUCCESSFULLY!")
-                print(f"📊 Mailjet Response: {result.json()}")
-                response_data = result.json()
-                if 'Messages' in response_data and response_data['Messages']:
-                    message_info = response_data['Messages'][0]
-                    print(f"📧 Message ID: {message_info.get('To', [{}])[0].get('MessageID', 'N/A')}")
-                    print(f"📧 Message UUID: {message_info.get('To', [{}])[0].get('MessageUUID', 'N/A')}")
-                    print(f"📧 Message Href: {message_info.get('To', [{}])[0].get('MessageHref', 'N/A')}")
-                print("="*70 + "\n")
-                return True
+                logger.debug("Mailjet accepted %d message(s): %s", len(messages), response_data)
             else:
-                print(f"❌ FAILED TO SEND EMAIL!")
-                print(f"📊 Status Code: {result.status_code}")
-                print(f"📊 Response: {result.json()}")
-                print("="*70 + "\n")
-                return False
+                logger.warning("Mailjet request failed with status %s: %s", result.status_code, response_data)
+            return sent
                 
         except Exception as e:
-            print(f"❌ EXCEPTION WHILE SENDING EMAIL: {e}")
-            print(f"📊 Exception Type: {type(e).__name__}")
-            print("="*70 + "\n")
-            return False
+            logger.error("Exception while sending email: %s (%s)", e, type(e).__name__)
+            return [False] * len(messages)
+    
+    def _encode_payload(self, messages: List[Dict[str, Any]]) -> bytes:
+        """Serialize a Mailjet send request body to UTF-8 JSON bytes."""
+        return orjson.dumps({'Messages': messages})
+    
+    async def send_email(self, to_email: str, to_name: str, subject: str, html_content: str, text_content: str = "") -> bool:
+        """Send an email using Mailjet API with detailed logging."""
+        message = self._build_message(to_email, to_name, subject, html_content, text_content)
+        return (await self.send_messages([message]))[0]
     
     def _html_to_text(self, html_content: str) -> str:
         """Convert HTML content to plain text (basic implementation)."""
         # Remove HTML tags
-        text = re.sub('<[^<]+?>', '', html_content)
+        text = TAG_PATTERN.sub('', html_content)
         # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        # Replace common HTML entities
-        text = text.replace('&nbsp;', ' ').replace('&amp;', '&').replace('&lt;', '<').replace('&gt;', '>')
-        return text
+        text = " ".join(text.split())
+        # Decode HTML entities, keeping non-breaking spaces as plain spaces
+        return html.unescape(text).translate(NBSP_TO_SPACE)
     
-    def send_welcome_email(self, client_data: Client) -> bool:
-        """Send welcome email to new client."""
-        print(f"\n🎯 PREPARING WELCOME EMAIL for {client_data.name}")
+    def _build_welcome_message(self, client_data: Client) -> Dict[str, Any]:
+        """Build the welcome email for a new client."""
+        name, email, phone = client_data.name, client_data.email, client_data.phone
+        client_type, property_type = client_data.client_type, client_data.property_type
+        budget = _format_budget(client_data.budget)
+        logger.debug("Preparing welcome email for %s", name)
         subject = "Welcome to AIREA Real Estate"
+        sender_email = self._sender_email_html
         
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Welcome to AIREA Real Estate</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white;">
-                <!-- Header -->
-                <div style="text-align: center; padding: 20px; border-bottom: 2px solid #53708B;">
-                    <h1 style="margin: 0; font-size: 24px; color: #111827;">AIREA Real Estate</h1>
-                    <p style="margin: 5px 0 0 0; font-size: 14px; color: #53708B;">Your Real Estate Partner</p>
-                </div>
-                
-                <!-- Main Content -->
-                <div style="padding: 30px 20px;">
-                    <h2 style="color: #111827; margin-top: 0;">Welcome, {client_data.name}</h2>
-                    
-                    <p style="font-size: 16px; margin-bottom: 20px; color: #333;">
-                        Thank you for choosing AIREA Real Estate. We're excited to help you with your real estate journey.
-                    </p>
-                    
-                    <!-- Client Info -->
-                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
-                        <h3 style="color: #111827; margin-top: 0; margin-bottom: 15px;">Your Information:</h3>
-                        <p style="margin: 5px 0; color: #333;"><strong>Client Type:</strong> {client_data.client_type}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Email:</strong> {client_data.email}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Phone:</strong> {client_data.phone}</p>
-                        {f'<p style="margin: 5px 0; color: #333;"><strong>Property Interest:</strong> {client_data.property_type}</p>' if client_data.property_type else ''}
-                        {f'<p style="margin: 5px 0; color: #333;"><strong>Budget:</strong> ${client_data.budget:,.2f}</p>' if client_data.budget else ''}
-                    </div>
-                    
-                    <p style="font-size: 16px; margin-bottom: 20px; color: #333;">
-                        Our team will contact you shortly to discuss your requirements and provide personalized property recommendations.
-                    </p>
-                    
-                    <p style="font-size: 16px; color: #333; margin-bottom: 0;">
-                        If you have any questions, please contact us at {self.config['sender_email']}
-                    </p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="text-align: center; padding: 20px; border-top: 1px solid #E5E7EB; color: #666; font-size: 14px;">
-                    <p style="margin: 0;">
-                        AIREA Real Estate<br>
-                        Email: {self.config['sender_email']}
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content = EMAIL_LAYOUT.substitute(
+            title="Welcome to AIREA Real Estate",
+            tagline="Your Real Estate Partner",
+            footer=f"Email: {sender_email}",
+            body=WELCOME_BODY.substitute(
+                name=html.escape(name),
+                client_info=_info_box("Your Information", [
+                    ("Client Type", client_type),
+                    ("Email", email),
+                    ("Phone", phone),
+                    ("Property Interest", property_type),
+                    ("Budget", budget)
+                ]),
+                sender_email=sender_email
+            )
+        )
         
-        text_content = f"""
-Welcome to AIREA Real Estate, {client_data.name}
-
-Thank you for choosing us as your real estate partner. We're excited to help you with your property needs.
-
-Your Information:
-- Client Type: {client_data.client_type}
-- Email: {client_data.email}
-- Phone: {client_data.phone}
-{f'- Property Interest: {client_data.property_type}' if client_data.property_type else ''}
-{f'- Budget: ${client_data.budget:,.2f}' if client_data.budget else ''}
-
-Our team will contact you shortly to discuss your requirements and provide personalized property recommendations.
-
-If you have any questions, please contact us at {self.config['sender_email']}
-
-Best regards,
-AIREA Real Estate Team
-"""
+        text_content = WELCOME_TEXT.substitute(
+            name=name,
+            client_type=client_type,
+            email=email,
+            phone=phone,
+            property_type_line=f'- Property Interest: {property_type}' if property_type else '',
+            budget_line=f'- Budget: {budget}' if budget else '',
+            sender_email=self.sender_email
+        )
         
-        return self.send_email(client_data.email, client_data.name, subject, html_content, text_content)
+        return self._build_message(email, name, subject, html_content, text_content)
     
-    def send_property_details_email(self, client_data: Client) -> bool:
-        """Send property details/appointment confirmation email."""
-        print(f"\n🏠 PREPARING PROPERTY DETAILS EMAIL for {client_data.name}")
+    async def send_welcome_email(self, client_data: Client) -> bool:
+        """Send welcome email to new client."""
+        if not self.auth:
+            logger.debug("Mailjet not configured, skipping welcome email")
+            return False
+        return (await self.send_messages([self._build_welcome_message(client_data)]))[0]
+    
+    def _build_property_message(self, client_data: Client) -> Dict[str, Any]:
+        """Build the property details/appointment confirmation email."""
+        name, address, details = client_data.name, client_data.address, client_data.details
+        appointment_time = _appointment_time(client_data)
+        logger.debug("Preparing property details email for %s", name)
         
-        if client_data.appointment and client_data.appointment_time:
+        if appointment_time:
             subject = "Appointment Confirmation - AIREA Real Estate"
-            appointment_section = f"""
-                <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
-                    <h3 style="color: #111827; margin-top: 0;">Appointment Scheduled</h3>
-                    <p style="margin: 5px 0; color: #333;"><strong>Date & Time:</strong> {client_data.appointment_time.strftime('%B %d, %Y at %I:%M %p')}</p>
-                    {f'<p style="margin: 5px 0; color: #333;"><strong>Location:</strong> {client_data.address}</p>' if client_data.address else ''}
-                </div>
-            """
         else:
             subject = "Property Interest Details - AIREA Real Estate"
-            appointment_section = ""
         
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Property Interest Details</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white;">
-                <!-- Header -->
-                <div style="text-align: center; padding: 20px; border-bottom: 2px solid #53708B;">
-                    <h1 style="margin: 0; font-size: 24px; color: #111827;">AIREA Real Estate</h1>
-                    <p style="margin: 5px 0 0 0; font-size: 14px; color: #53708B;">Property Interest Details</p>
-                </div>
-                
-                <!-- Main Content -->
-                <div style="padding: 30px 20px;">
-                    <p style="font-size: 16px; margin-bottom: 20px; color: #333;">Dear {client_data.name},</p>
-                    
-                    <p style="font-size: 16px; margin-bottom: 20px; color: #333;">
-                        Thank you for your interest in our real estate services. Here are your requirements:
-                    </p>
-                    
-                    <!-- Requirements -->
-                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
-                        <h3 style="color: #111827; margin-top: 0; margin-bottom: 15px;">Your Requirements:</h3>
-                        <p style="margin: 5px 0; color: #333;"><strong>Looking to:</strong> {client_data.client_type}</p>
-                        {f'<p style="margin: 5px 0; color: #333;"><strong>Property Type:</strong> {client_data.property_type}</p>' if client_data.property_type else ''}
-                        {f'<p style="margin: 5px 0; color: #333;"><strong>Budget:</strong> ${client_data.budget:,.2f}</p>' if client_data.budget else ''}
-                        {f'<p style="margin: 5px 0; color: #333;"><strong>Location:</strong> {client_data.address}</p>' if client_data.address else ''}
-                    </div>
-                    
-                    {appointment_section}
-                    
-                    {f'<div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;"><h4 style="color: #111827; margin-top: 0;">Additional Notes:</h4><p style="color: #333; margin-bottom: 0;">{client_data.details}</p></div>' if client_data.details else ''}
-                    
-                    <p style="font-size: 16px; margin-bottom: 20px; color: #333;">
-                        Our agent will contact you shortly to provide tailored property options that match your requirements.
-                    </p>
-                </div>
-                
-                <!-- Footer -->
-                <div style="text-align: center; padding: 20px; border-top: 1px solid #E5E7EB; color: #666; font-size: 14px;">
-                    <p style="margin: 0;">
-                        AIREA Real Estate<br>
-                        Email: {self.config['sender_email']}
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        requirements = [
+            ("Looking to", client_data.client_type),
+            ("Property Type", client_data.property_type),
+            ("Budget", _format_budget(client_data.budget)),
+            ("Location", address)
+        ]
+        
+        html_content = EMAIL_LAYOUT.substitute(
+            title="Property Interest Details",
+            tagline="Property Interest Details",
+            footer=f"Email: {self._sender_email_html}",
+            body=PROPERTY_BODY.substitute(
+                name=html.escape(name),
+                requirements=_info_box("Your Requirements", requirements),
+                appointment_section=_appointment_section(appointment_time, "Location", address),
+                notes_section=_notes_section("Additional Notes", details)
+            )
+        )
         
-        return self.send_email(client_data.email, client_data.name, subject, html_content)
+        text_content = PROPERTY_TEXT.substitute(
+            name=name,
+            requirements=_text_rows("Your Requirements", requirements),
+            appointment_section=_appointment_text(appointment_time, "Location", address),
+            notes_section=_text_section("Additional Notes", details)
+        )
+        
+        return self._build_message(client_data.email, name, subject, html_content, text_content)
     
-    def send_agent_notification(self, client_data: Client, is_new_client: bool) -> bool:
-        """Send notification to the agent about new lead/appointment."""
-        print(f"\n🚨 PREPARING AGENT NOTIFICATION for {client_data.name} ({'NEW' if is_new_client else 'EXISTING'} client)")
+    async def send_property_details_email(self, client_data: Client) -> bool:
+        """Send property details/appointment confirmation email."""
+        if not self.auth:
+            logger.debug("Mailjet not configured, skipping property details email")
+            return False
+        return (await self.send_messages([self._build_property_message(client_data)]))[0]
+    
+    def _build_agent_message(self, client_data: Client, is_new_client: bool) -> Dict[str, Any]:
+        """Build the agent notification about a new lead/appointment."""
+        name, address, details = client_data.name, client_data.address, client_data.details
+        appointment_time = _appointment_time(client_data)
+        logger.debug("Preparing agent notification for %s (%s client)", name, "new" if is_new_client else "existing")
         
-        subject = f"{'New Client Lead' if is_new_client else 'Client Update'} - {client_data.name}"
+        heading = 'New Client Lead' if is_new_client else 'Client Update'
+        subject = f"{heading} - {name}"
+        client_info = [
+            ("Name", name),
+            ("Email", client_data.email),
+            ("Phone", client_data.phone),
+            ("Type", client_data.client_type)
+        ]
+        requirements = [
+            ("Property Type", client_data.property_type or 'Not specified'),
+            ("Budget", _format_budget(client_data.budget) or 'Not specified'),
+            ("Location", address or 'Not specified')
+        ]
         
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Client Alert</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white;">
-                <!-- Header -->
-                <div style="text-align: center; padding: 20px; border-bottom: 2px solid #53708B;">
-                    <h1 style="margin: 0; font-size: 24px; color: #111827;">AIREA Real Estate</h1>
-                    <p style="margin: 5px 0 0 0; font-size: 14px; color: #53708B;">{'New' if is_new_client else 'Returning'} Client Notification</p>
-                </div>
-                
-                <!-- Main Content -->
-                <div style="padding: 30px 20px;">
-                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
-                        <h3 style="color: #111827; margin-top: 0; margin-bottom: 15px;">Client Information:</h3>
-                        <p style="margin: 5px 0; color: #333;"><strong>Name:</strong> {client_data.name}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Email:</strong> {client_data.email}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Phone:</strong> {client_data.phone}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Type:</strong> {client_data.client_type}</p>
-                    </div>
-                    
-                    <!-- Property Requirements -->
-                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
-                        <h3 style="color: #111827; margin-top: 0; margin-bottom: 15px;">Property Requirements:</h3>
-                        <p style="margin: 5px 0; color: #333;"><strong>Property Type:</strong> {client_data.property_type if client_data.property_type else 'Not specified'}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Budget:</strong> {f'${client_data.budget:,.2f}' if client_data.budget else 'Not specified'}</p>
-                        <p style="margin: 5px 0; color: #333;"><strong>Location:</strong> {client_data.address if client_data.address else 'Not specified'}</p>
-                    </div>
-                    
-                    {f'''
-                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;">
-                        <h3 style="color: #111827; margin-top: 0;">Appointment Scheduled</h3>
-                        <p style="margin: 5px 0; color: #333;"><strong>Date & Time:</strong> {client_data.appointment_time.strftime('%B %d, %Y at %I:%M %p')}</p>
-                        {f'<p style="margin: 5px 0; color: #333;"><strong>Meeting Location:</strong> {client_data.address}</p>' if client_data.address else ''}
-                    </div>
-                    ''' if client_data.appointment and client_data.appointment_time else ''}
-                    
-                    {f'<div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0;"><h4 style="color: #111827; margin-top: 0;">Client Notes:</h4><p style="color: #333; margin-bottom: 0;">{client_data.details}</p></div>' if client_data.details else ''}
-                    
-                    <div style="background-color: #E5E7EB; padding: 20px; margin: 20px 0; text-align: center;">
-                        <h3 style="color: #111827; margin-top: 0; margin-bottom: 10px;">ACTION REQUIRED</h3>
-                        <p style="color: #333; margin-bottom: 0;">Please follow up with this client as soon as possible.</p>
-                    </div>
-                </div>
-                
-                <!-- Footer -->
-                <div style="text-align: center; padding: 20px; border-top: 1px solid #E5E7EB; color: #666; font-size: 14px;">
-                    <p style="margin: 0;">
-                        AIREA Real Estate<br>
-                        Agent Dashboard Alert System
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content = EMAIL_LAYOUT.substitute(
+            title="Client Alert",
+            tagline=f"{'New' if is_new_client else 'Returning'} Client Notification",
+            footer="Agent Dashboard Alert System",
+            body=AGENT_BODY.substitute(
+                client_info=_info_box("Client Information", client_info),
+                requirements=_info_box("Property Requirements", requirements),
+                appointment_section=_appointment_section(appointment_time, "Meeting Location", address),
+                notes_section=_notes_section("Client Notes", details)
+            )
+        )
+        
+        text_content = AGENT_TEXT.substitute(
+            heading=heading,
+            name=name,
+            client_info=_text_rows("Client Information", client_info),
+            requirements=_text_rows("Property Requirements", requirements),
+            appointment_section=_appointment_text(appointment_time, "Meeting Location", address),
+            notes_section=_text_section("Client Notes", details)
+        )
         
-        return self.send_email(self.config['agent_email'], "AIREA Agent", subject, html_content)
+        return self._build_message(self.agent_email, "AIREA Agent", subject, html_content, text_content)
+    
+    async def send_agent_notification(self, client_data: Client, is_new_client: bool) -> bool:
+        """Send notification to the agent about new lead/appointment."""
+        if not self.auth:
+            logger.debug("Mailjet not configured, skipping agent notification")
+            return False
+        return (await self.send_messages([self._build_agent_message(client_data, is_new_client)]))[0]
     
     def send_manual_lead_processing_email(self, client_data: Client, is_new_client: bool, processing_method: str = "Manual") -> dict:
-        """Send all emails for a manually processed lead and return detailed results."""
-        print(f"\n🔧 MANUAL LEAD PROCESSING INITIATED for {client_data.name}")
-        print(f"📊 Processing Method: {processing_method}")
-        print(f"👤 Client Type: {'NEW' if is_new_client else 'EXISTING'}")
+        """Queue all emails for a processed lead and return without waiting for Mailjet.
+        
+        Use `process_lead_emails` to send immediately and get detailed results.
+        """
+        job = LeadJob(uuid.uuid4().hex, client_data, is_new_client, processing_method)
+        self._ensure_worker()
+        self._queue.put_nowait(job)
+        return {"status": "queued", "job_id": job.job_id}
+    
+    def _ensure_worker(self) -> None:
+        """Start the mail worker thread on first use."""
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._mail_worker, name="mailjet-worker", daemon=True)
+                self._worker.start()
+    
+    def _stop_worker(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        """Ask the mail worker to exit after the jobs already queued, and wait for it."""
+        with self._worker_lock:
+            worker, self._worker = self._worker, None
+            if worker is None or not worker.is_alive():
+                return
+            self._queue.put_nowait(None)
+        worker.join(timeout)
+        if worker.is_alive():
+            logger.warning("Mail worker still sending after %.0fs; remaining jobs may be lost", timeout)
+    
+    def _mail_worker(self) -> None:
+        """Send queued lead emails on a private event loop, reusing its HTTP connections."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                job = self._queue.get()
+                try:
+                    if job is None:
+                        return
+                    results = loop.run_until_complete(self.process_lead_emails(
+                        job.client_data, job.is_new_client, job.processing_method
+                    ))
+                    if results["errors"]:
+                        logger.warning("Lead email job %s for %s: %s", job.job_id, job.client_data.email, results["errors"])
+                except Exception as e:
+                    logger.error("Lead email job %s failed: %s", job.job_id, e)
+                finally:
+                    self._queue.task_done()
+        finally:
+            # The worker's HTTP client is bound to this loop, so close it before the loop goes away
+            loop.run_until_complete(self.aclose())
+            loop.close()
+    
+    async def process_lead_emails(self, client_data: Client, is_new_client: bool, processing_method: str = "Manual") -> dict:
+        """Send all emails for a processed lead and return detailed results."""
+        logger.debug(
+            "Lead processing for %s (method: %s, %s client)",
+            client_data.name, processing_method, "new" if is_new_client else "existing"
+        )
         
         results = {
             "client_name": client_data.name,
@@ -361,36 +538,38 @@ AIREA Real Estate Team
         }
         
         try:
-            # Send welcome email for new clients
+            builders = []
             if is_new_client:
-                print(f"📧 Sending welcome email to new client...")
-                results["emails_sent"]["welcome_email"] = self.send_welcome_email(client_data)
-                if not results["emails_sent"]["welcome_email"]:
-                    results["errors"].append("Failed to send welcome email")
+                builders.append(("welcome_email", "welcome email", lambda: self._build_welcome_message(client_data)))
+            builders.append(("property_details_email", "property details email", lambda: self._build_property_message(client_data)))
+            builders.append(("agent_notification", "agent notification", lambda: self._build_agent_message(client_data, is_new_client)))
             
-            # Send property details email
-            print(f"📧 Sending property details email...")
-            results["emails_sent"]["property_details_email"] = self.send_property_details_email(client_data)
-            if not results["emails_sent"]["property_details_email"]:
-                results["errors"].append("Failed to send property details email")
+            # Build each email separately so one failure does not stop the others being sent
+            messages = {}
+            for email_type, label, build in builders:
+                try:
+                    messages[email_type] = build()
+                except Exception as e:
+                    results["errors"].append(f"Failed to build {label}: {e}")
             
-            # Send agent notification
-            print(f"📧 Sending agent notification...")
-            results["emails_sent"]["agent_notification"] = self.send_agent_notification(client_data, is_new_client)
-            if not results["emails_sent"]["agent_notification"]:
-                results["errors"].append("Failed to send agent notification")
+            # All of the lead's emails go out in one Mailjet request
+            if messages:
+                for email_type, sent in zip(messages, await self.send_messages(list(messages.values()))):
+                    results["emails_sent"][email_type] = sent
             
-            # Summary
-            total_sent = sum(results["emails_sent"].values())
-            total_attempted = len([k for k, v in results["emails_sent"].items() if k != "welcome_email" or is_new_client])
-            
-            print(f"\n📊 MANUAL PROCESSING SUMMARY:")
-            print(f"   ✅ Emails Sent: {total_sent}/{total_attempted}")
-            print(f"   ❌ Errors: {len(results['errors'])}")
-            if results["errors"]:
-                for error in results["errors"]:
-                    print(f"      - {error}")
-            print("="*70)
+            # Summary, counted in the same pass that reports failed sends
+            total_sent = 0
+            total_attempted = len(builders)
+            for email_type, label, _ in builders:
+                if results["emails_sent"][email_type]:
+                    total_sent += 1
+                elif email_type in messages:
+                    results["errors"].append(f"Failed to send {label}")
+
+            logger.debug(
+                "Lead processing summary for %s: %d/%d emails sent, errors: %s",
+                client_data.name, total_sent, total_attempted, results["errors"] or "none"
+            )
             
             results["success"] = len(results["errors"]) == 0
             results["total_emails_sent"] = total_sent
@@ -398,7 +577,7 @@ AIREA Real Estate Team
             
         except Exception as e:
             error_msg = f"Exception during manual processing: {e}"
-            print(f"❌ {error_msg}")
+            logger.error(error_msg)
             results["errors"].append(error_msg)
             results["success"] = False
         
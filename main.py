@@ -6,11 +6,15 @@ AI-powered real estate assistant with lead management
 from fastapi import FastAPI, HTTPException, Depends, APIRouter, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from pydantic import ValidationError
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
-import json
+import orjson
+import logging
+import logging.handlers
+import queue
 import uvicorn
 from pathlib import Path
 
@@ -24,6 +28,17 @@ from database import DatabaseManager
 from email_service import MailjetEmailService
 from ai_service import AIService
 from conversation_manager import ConversationManager
+from conversation_store import RedisConversationStore
+
+# Log records are written by a background listener thread so request handlers never block on the stream
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(), respect_handler_level=True)
+logging.basicConfig(
+    level=Config.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(log_queue)]
+)
+log_listener.start()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -39,13 +54,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Conversation-ID"],
 )
 
 # Initialize services
-db_manager = DatabaseManager(Config.DATABASE_PATH)
+db_manager = DatabaseManager(Config.DATABASE_PATH, shared_cache=Config.DATABASE_SHARED_CACHE)
 email_service = MailjetEmailService(Config.EMAIL_CONFIG)
 ai_service = AIService()
-conversation_manager = ConversationManager(db_manager, ai_service)
+shared_conversation_store = (
+    RedisConversationStore(Config.REDIS_URL, ttl_seconds=Config.CONVERSATION_TTL_HOURS * 3600)
+    if Config.REDIS_URL else None
+)
+conversation_manager = ConversationManager(db_manager, ai_service, shared_conversation_store)
 
 # Validate configuration on startup
 if not Config.validate_email_config():
@@ -63,8 +83,13 @@ def get_conversation_manager():
     """Dependency to get conversation manager."""
     return conversation_manager
 
-def process_client_data(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService) -> tuple[int, List[str]]:
-    """Process extracted client data: save to DB and send emails."""
+def process_client_data(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService, processing_method: str) -> tuple[int, List[str]]:
+    """Process extracted client data: save to DB and queue emails.
+    
+    Emails are sent by the email service's background worker, so Mailjet
+    failures are logged there rather than returned here. `processing_method`
+    ("Automatic" or "Manual") labels the agent notification.
+    """
     processed_count = 0
     errors = []
     
@@ -75,19 +100,13 @@ def process_client_data(clients_list: List[Client], db: DatabaseManager, email_s
             
             if is_new_client:
                 print(f"New client added: {client_data.name} ({client_data.email})")
-                # Send welcome email to new client
-                if email_svc.is_configured() and not email_svc.send_welcome_email(client_data):
-                    errors.append(f"Failed to send welcome email to {client_data.email}")
             else:
                 print(f"Existing client updated: {client_data.name} ({client_data.email})")
             
-            # Send property details/appointment email
-            if email_svc.is_configured() and not email_svc.send_property_details_email(client_data):
-                errors.append(f"Failed to send property details email to {client_data.email}")
-            
-            # Notify agent
-            if email_svc.is_configured() and not email_svc.send_agent_notification(client_data, is_new_client):
-                errors.append(f"Failed to send agent notification for {client_data.email}")
+            # Queue the welcome email (new clients only), property details/appointment
+            # email and agent notification; they go out in a single Mailjet request
+            if email_svc.is_configured():
+                email_svc.send_manual_lead_processing_email(client_data, is_new_client, processing_method)
             
             processed_count += 1
             
@@ -171,6 +190,61 @@ async def chat_endpoint(
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+@api_router.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    conv_manager: ConversationManager = Depends(get_conversation_manager),
+    db: DatabaseManager = Depends(get_database),
+    email_svc: MailjetEmailService = Depends(get_email_service)
+):
+    """Streaming chat endpoint: sends the AI response as plain-text chunks as they arrive.
+    
+    The conversation ID is returned in the X-Conversation-ID response header.
+    """
+    # Generate conversation ID if not provided
+    conv_id = request.conversation_id or conv_manager.create_conversation()
+    
+    # Add user message to conversation
+    conv_manager.add_message(conv_id, ChatMessage(role="user", content=request.message))
+    
+    conversation_history = conv_manager.get_conversation(conv_id)
+    if not conversation_history:
+        raise HTTPException(status_code=500, detail="Failed to retrieve conversation history")
+    history_snapshot = list(conversation_history)
+    
+    async def stream_response():
+        chunks = []
+        try:
+            # The blocking SDK iterator runs in the threadpool; everything else stays on the loop
+            async for chunk in iterate_in_threadpool(ai_service.generate_chat_response_stream(history_snapshot)):
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            # Record the response on the event loop, including a partial one if the client disconnected
+            if chunks:
+                conv_manager.add_message(conv_id, ChatMessage(role="assistant", content="".join(chunks)))
+    
+    # Runs after the stream completes, once the assistant message is recorded
+    background_tasks.add_task(auto_process_if_ready, conv_id, conv_manager, db, email_svc)
+    
+    return StreamingResponse(
+        stream_response(),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Conversation-ID": conv_id},
+        background=background_tasks
+    )
+
+async def auto_process_if_ready(
+    conversation_id: str,
+    conv_manager: ConversationManager,
+    db: DatabaseManager,
+    email_svc: MailjetEmailService
+):
+    """Background task to process a conversation if it is ready for data extraction."""
+    if conv_manager.should_extract_data(conversation_id):
+        await auto_process_conversation(conversation_id, conv_manager, db, email_svc)
+
 async def auto_process_conversation(
     conversation_id: str,
     conv_manager: ConversationManager,
@@ -182,7 +256,7 @@ async def auto_process_conversation(
         result = conv_manager.extract_and_process_clients(conversation_id)
         if result.get("success") and result.get("clients"):
             # Process clients (save to DB and send emails)
-            processed_count, errors = process_client_data(result["clients"], db, email_svc)
+            processed_count, errors = process_client_data(result["clients"], db, email_svc, "Automatic")
             print(f"Auto-processed {processed_count} clients from conversation {conversation_id}")
             if errors:
                 print(f"Errors during auto-processing: {errors}")
@@ -211,18 +285,17 @@ async def process_conversation_endpoint(
         clients_extracted = len(clients_list)
         
         # Process clients (save to DB and send emails)
-        processed_count, errors = process_client_data(clients_list, db, email_service)
+        processed_count, errors = process_client_data(clients_list, db, email_service, "Manual")
         
-        # Save conversation history for each client
-        for client_data in clients_list:
-            try:
-                interaction_data = {
-                    "conversation": [msg.dict() for msg in request.conversation_history],
-                    "processed_at": datetime.now().isoformat()
-                }
-                db.save_interaction(client_data.email, json.dumps(interaction_data))
-            except Exception as e:
-                errors.append(f"Error saving interaction for {client_data.email}: {str(e)}")
+        # Save conversation history for each client in one transaction
+        try:
+            interaction_json = orjson.dumps({
+                "conversation": [msg.dict() for msg in request.conversation_history],
+                "processed_at": datetime.now().isoformat()
+            }).decode()
+            db.save_interactions([(client_data.email, interaction_json) for client_data in clients_list])
+        except Exception as e:
+            errors.append(f"Error saving interactions: {str(e)}")
         
         return ProcessDataResponse(
             clients_extracted=clients_extracted,
@@ -256,7 +329,7 @@ async def process_conversation_by_id(
         clients_list = result.get("clients", [])
         
         # Process clients (save to DB and send emails)
-        processed_count, errors = process_client_data(clients_list, db, email_service)
+        processed_count, errors = process_client_data(clients_list, db, email_service, "Manual")
         
         return ProcessDataResponse(
             clients_extracted=len(clients_list),
@@ -328,10 +401,13 @@ async def get_conversation(
         raise HTTPException(status_code=500, detail=f"Error retrieving conversation: {str(e)}")
 
 @api_router.get("/conversations", response_model=ConversationListResponse)
-async def list_conversations(conv_manager: ConversationManager = Depends(get_conversation_manager)):
-    """List all active conversations."""
+async def list_conversations(
+    limit: Optional[int] = None,
+    conv_manager: ConversationManager = Depends(get_conversation_manager)
+):
+    """List active conversations, most recent first (optionally only the first `limit`)."""
     try:
-        summaries = conv_manager.list_active_conversations()
+        summaries = conv_manager.list_active_conversations(limit)
         
         conversation_summaries = []
         for summary in summaries:
@@ -344,7 +420,7 @@ async def list_conversations(conv_manager: ConversationManager = Depends(get_con
         
         return ConversationListResponse(
             conversations=conversation_summaries,
-            total_count=len(conversation_summaries)
+            total_count=conv_manager.count_active_conversations()
         )
         
     except Exception as e:
@@ -404,7 +480,7 @@ async def test_email(email_service: MailjetEmailService = Depends(get_email_serv
     )
     
     # Try to send test email
-    success = email_service.send_welcome_email(test_client)
+    success = await email_service.send_welcome_email(test_client)
     
     return {
         "success": success,
@@ -434,6 +510,12 @@ async def cleanup_old_conversations(
 # Include API router
 app.include_router(api_router)
 
+@app.on_event("shutdown")
+async def close_email_service():
+    """Send queued lead emails, close pooled Mailjet connections and flush queued log records."""
+    await email_service.close()
+    log_listener.stop()
+
 # Frontend serving routes
 frontend_path = Path(Config.FRONTEND_PATH)
 
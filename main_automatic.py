@@ -63,7 +63,7 @@ def get_conversation_manager():
     """Dependency to get conversation manager."""
     return conversation_manager
 
-def process_client_data(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService, processing_method: str = "Automatic") -> tuple[int, List[str]]:
+async def process_client_data(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService, processing_method: str = "Automatic") -> tuple[int, List[str]]:
     """Process extracted client data: save to DB and send emails with enhanced logging."""
     processed_count = 0
     errors = []
@@ -90,7 +90,7 @@ def process_client_data(clients_list: List[Client], db: DatabaseManager, email_s
             
             # Use the enhanced email processing function for automatic sending
             if email_svc.is_configured():
-                email_result = email_svc.send_manual_lead_processing_email(
+                email_result = await email_svc.process_lead_emails(
                     client_data, is_new_client, processing_method
                 )
                 
@@ -219,7 +219,7 @@ async def auto_process_conversation(
         result = conv_manager.extract_and_process_clients(conversation_id)
         if result.get("success") and result.get("clients"):
             # Process clients with enhanced logging (save to DB and send emails)
-            processed_count, errors = process_client_data(result["clients"], db, email_svc, "Automatic Background")
+            processed_count, errors = await process_client_data(result["clients"], db, email_svc, "Automatic Background")
             print(f"✅ Auto-processed {processed_count} clients from conversation {conversation_id}")
             if errors:
                 print(f"❌ Errors during auto-processing: {errors}")
@@ -255,7 +255,7 @@ async def process_conversation_endpoint(
         print(f"✅ Extracted {clients_extracted} clients from conversation")
         
         # Process clients with enhanced logging
-        processed_count, errors = process_client_data(
+        processed_count, errors = await process_client_data(
             clients_list, db, email_service, "Manual API Call"
         )
         
@@ -311,7 +311,7 @@ async def process_conversation_by_id(
         print(f"✅ Extracted {len(clients_list)} clients from conversation {conversation_id}")
         
         # Process clients with enhanced logging
-        processed_count, errors = process_client_data(
+        processed_count, errors = await process_client_data(
             clients_list, db, email_service, f"Manual Processing (Conv: {conversation_id})"
         )
         
@@ -464,7 +464,7 @@ async def test_email(email_service: MailjetEmailService = Depends(get_email_serv
     print(f"\n🧪 TESTING EMAIL FUNCTIONALITY")
     
     # Try to send test emails with detailed logging
-    email_results = email_service.send_manual_lead_processing_email(
+    email_results = await email_service.process_lead_emails(
         test_client, True, "Email Test"
     )
     
@@ -63,7 +63,7 @@ def get_conversation_manager():
     """Dependency to get conversation manager."""
     return conversation_manager
 
-def process_client_data(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService) -> tuple[int, List[str]]:
+async def process_client_data(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService) -> tuple[int, List[str]]:
     """Process extracted client data: save to DB and send emails."""
     processed_count = 0
     errors = []
@@ -76,17 +76,17 @@ def process_client_data(clients_list: List[Client], db: DatabaseManager, email_s
             if is_new_client:
                 print(f"New client added: {client_data.name} ({client_data.email})")
                 # Send welcome email to new client
-                if email_svc.is_configured() and not email_svc.send_welcome_email(client_data):
+                if email_svc.is_configured() and not await email_svc.send_welcome_email(client_data):
                     errors.append(f"Failed to send welcome email to {client_data.email}")
             else:
                 print(f"Existing client updated: {client_data.name} ({client_data.email})")
             
             # Send property details/appointment email
-            if email_svc.is_configured() and not email_svc.send_property_details_email(client_data):
+            if email_svc.is_configured() and not await email_svc.send_property_details_email(client_data):
                 errors.append(f"Failed to send property details email to {client_data.email}")
             
             # Notify agent
-            if email_svc.is_configured() and not email_svc.send_agent_notification(client_data, is_new_client):
+            if email_svc.is_configured() and not await email_svc.send_agent_notification(client_data, is_new_client):
                 errors.append(f"Failed to send agent notification for {client_data.email}")
             
             processed_count += 1
@@ -182,7 +182,7 @@ async def auto_process_conversation(
         result = conv_manager.extract_and_process_clients(conversation_id)
         if result.get("success") and result.get("clients"):
             # Process clients (save to DB and send emails)
-            processed_count, errors = process_client_data(result["clients"], db, email_svc)
+            processed_count, errors = await process_client_data(result["clients"], db, email_svc)
             print(f"Auto-processed {processed_count} clients from conversation {conversation_id}")
             if errors:
                 print(f"Errors during auto-processing: {errors}")
@@ -211,7 +211,7 @@ async def process_conversation_endpoint(
         clients_extracted = len(clients_list)
         
         # Process clients (save to DB and send emails)
-        processed_count, errors = process_client_data(clients_list, db, email_service)
+        processed_count, errors = await process_client_data(clients_list, db, email_service)
         
         # Save conversation history for each client
         for client_data in clients_list:
@@ -256,7 +256,7 @@ async def process_conversation_by_id(
         clients_list = result.get("clients", [])
         
         # Process clients (save to DB and send emails)
-        processed_count, errors = process_client_data(clients_list, db, email_service)
+        processed_count, errors = await process_client_data(clients_list, db, email_service)
         
         return ProcessDataResponse(
             clients_extracted=len(clients_list),
@@ -404,7 +404,7 @@ async def test_email(email_service: MailjetEmailService = Depends(get_email_serv
     )
     
     # Try to send test email
-    success = email_service.send_welcome_email(test_client)
+    success = await email_service.send_welcome_email(test_client)
     
     return {
         "success": success,
@@ -63,7 +63,7 @@ def get_conversation_manager():
     """Dependency to get conversation manager."""
     return conversation_manager
 
-def process_client_data_enhanced(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService, processing_method: str = "Manual") -> tuple[int, List[str], List[dict]]:
+async def process_client_data_enhanced(clients_list: List[Client], db: DatabaseManager, email_svc: MailjetEmailService, processing_method: str = "Manual") -> tuple[int, List[str], List[dict]]:
     """Process extracted client data: save to DB and send emails with detailed logging."""
     processed_count = 0
     errors = []
@@ -91,7 +91,7 @@ def process_client_data_enhanced(clients_list: List[Client], db: DatabaseManager
             
             # Use the enhanced email processing function
             if email_svc.is_configured():
-                email_result = email_svc.send_manual_lead_processing_email(
+                email_result = await email_svc.process_lead_emails(
                     client_data, is_new_client, processing_method
                 )
                 email_results.append(email_result)
@@ -226,7 +226,7 @@ async def process_conversation_endpoint(
         print(f"✅ Extracted {clients_extracted} clients from conversation")
         
         # Process clients with enhanced logging
-        processed_count, errors, email_results = process_client_data_enhanced(
+        processed_count, errors, email_results = await process_client_data_enhanced(
             clients_list, db, email_service, "Manual API Call"
         )
         
@@ -282,7 +282,7 @@ async def process_conversation_by_id(
         print(f"✅ Extracted {len(clients_list)} clients from conversation {conversation_id}")
         
         # Process clients with enhanced logging
-        processed_count, errors, email_results = process_client_data_enhanced(
+        processed_count, errors, email_results = await process_client_data_enhanced(
             clients_list, db, email_service, f"Manual Processing (Conv: {conversation_id})"
         )
         
@@ -435,7 +435,7 @@ async def test_email(email_service: MailjetEmailService = Depends(get_email_serv
     print(f"\n🧪 TESTING EMAIL FUNCTIONALITY")
     
     # Try to send test emails with detailed logging
-    email_results = email_service.send_manual_lead_processing_email(
+    email_results = await email_service.process_lead_emails(
         test_client, True, "Email Test"
     )
     
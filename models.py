@@ -1,7 +1,7 @@
 """Pydantic models for AIREA Real Estate Chatbot."""
 
 from pydantic import BaseModel, EmailStr, Field, ValidationError
-from typing import Optional, Literal, List
+from typing import Optional, Literal, List, Tuple
 from datetime import datetime
 
 class Client(BaseModel):
@@ -16,6 +16,21 @@ class Client(BaseModel):
     appointment: Optional[bool] = Field(None, description="Whether the client is available for an appointment")
     appointment_time: Optional[datetime] = Field(None, description="Time for the appointment")
     details: Optional[str] = Field(None, min_length=1, description="Additional details about the client")
+    
+    def as_db_row(self) -> Tuple:
+        """Column values in the order the clients upsert binds them."""
+        return (
+            self.client_type,
+            self.name,
+            self.phone,
+            self.email,
+            self.property_type,
+            self.address,
+            self.budget,
+            self.appointment,
+            self.appointment_time.isoformat() if self.appointment_time else None,
+            self.details
+        )
 
 class ChatMessage(BaseModel):
     """Chat message model."""
@@ -49,6 +64,14 @@ class ClientResponse(BaseModel):
     clients: List[Client] = Field(..., description="List of clients")
     total_count: int = Field(..., description="Total number of clients")
 
+class StageAnalysis(BaseModel):
+    """Conversation stage analysis model."""
+    stage: str = Field(..., description="Current conversation stage")
+    collected_info: List[str] = Field(default_factory=list, description="Information collected so far")
+    missing_info: List[str] = Field(default_factory=list, description="Information still needed")
+    ready_for_next_step: bool = Field(True, description="Whether the user is ready for the next step")
+    concerns: List[str] = Field(default_factory=list, description="Concerns or hesitations detected")
+
 class ConversationSummary(BaseModel):
     """Conversation summary model."""
     conversation_id: str = Field(..., description="Conversation ID")
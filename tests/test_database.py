@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from database import DatabaseManager
+
+
+def _messages(*contents):
+    return [{"role": "user", "content": content} for content in contents]
+
+
+class SaveConversationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "test.db"))
+        self.db.save_conversation("conv", _messages("hi", "yo", "3"))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def stored(self):
+        conversation = self.db.get_conversation("conv")
+        return conversation["message_count"], [m["content"] for m in conversation["messages"]]
+
+    def test_appends_new_messages(self):
+        self.db.save_conversation("conv", _messages("hi", "yo", "3", "4"))
+        self.assertEqual(self.stored(), (4, ["hi", "yo", "3", "4"]))
+
+    def test_shortened_conversation_is_rewritten(self):
+        self.db.save_conversation("conv", _messages("X"))
+        self.assertEqual(self.stored(), (1, ["X"]))
+
+    def test_same_length_with_different_messages_is_rewritten(self):
+        self.db.save_conversation("conv", _messages("a", "b", "c"))
+        self.assertEqual(self.stored(), (3, ["a", "b", "c"]))
+
+    def test_divergent_longer_conversation_is_rewritten(self):
+        self.db.save_conversation("conv", _messages("a", "b", "c", "d"))
+        self.assertEqual(self.stored(), (4, ["a", "b", "c", "d"]))
+
+
+if __name__ == "__main__":
+    unittest.main()